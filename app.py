@@ -3,6 +3,8 @@ import importlib.util
 import os
 import sys
 
+from utils.modeling_utils import load_models
+
 # Set the page title and icon
 st.set_page_config(
     page_title="China Air Quality Insights",
@@ -10,6 +12,9 @@ st.set_page_config(
     layout="wide"
 )
 
+# Start loading the models in the background, so they are ready by the time a page needs them
+load_models().prefetch()
+
 st.sidebar.title("Dashboard")
 
 page_names = {
@@ -17,7 +22,8 @@ page_names = {
     "Transform Data Overview" : "transformed_data_overview",
     "Data Visualizations": "visualization",
     "Modeling & Prediction": "modeling_prediction",
-    "Insights & Summary": "summary"
+    "Insights & Summary": "summary",
+    "Diagnostics": "diagnostics"
 }
 
 
@@ -0,0 +1,47 @@
+import streamlit as st
+from utils.profiling import (
+    HIT_LOG_SAMPLE,
+    STAGE_LOG,
+    STAGE_LOG_MAX_BYTES,
+    read_stage_log,
+    rss_bytes,
+    summarize_stages
+)
+
+def run():
+  st.title("Pipeline Diagnostics")
+  st.markdown("Every pipeline stage, cached loader and model load is timed as it runs. Each call records wall time, CPU time, peak memory, rows in/out and whether it was served from the cache.")
+
+  records = read_stage_log()
+  if records.empty:
+      st.info("No stages recorded yet. Open the other pages first.")
+      return
+
+  summary = summarize_stages(records)
+
+  rss = rss_bytes()
+  cached_calls = max(summary['cache_hits'].sum() + summary['cache_misses'].sum(), 1)
+  col1, col2, col3 = st.columns(3)
+  col1.metric("Recorded calls", f"{summary['calls'].sum():,.0f}")
+  col2.metric("Cache hit rate", f"{summary['cache_hits'].sum() / cached_calls:.0%}")
+  col3.metric("Server RSS", f"{rss / 2**20:,.0f} MiB" if rss is not None else "n/a")
+
+  st.subheader("Slowest stages")
+  st.bar_chart(summary['wall_seconds_max'])
+
+  st.subheader("Per-stage summary")
+  st.dataframe(summary)
+
+  st.subheader("Recent calls")
+  st.dataframe(records.tail(200).iloc[::-1], hide_index=True)
+
+  # Same JSON lines as the log file, for offline regression tracking
+  st.download_button(
+      label="📥 Download stage log (JSONL)",
+      data=records.to_json(orient='records', lines=True),
+      file_name='stage_log.jsonl',
+      mime='application/jsonl'
+  )
+  if STAGE_LOG:
+      st.caption(f"The server appends cache misses, uncached stages and one in {HIT_LOG_SAMPLE} cache hits "
+                 f"to `{STAGE_LOG}`, rotating it to `{STAGE_LOG}.1` past {STAGE_LOG_MAX_BYTES / 2**20:g} MiB.")
@@ -1,14 +1,13 @@
 import streamlit as st
 from utils.plot_utils import plot_top_feature_importance
-from utils.preprocessing import (
-    load_data,
-    handling_missing_values,
-    outlier_handling,
-    execute_feature_extraction_operations
-)
+from utils.render_cache import show_chart
+from utils.feature_store import current_store_version, load_transformed_dataset
+from utils.query import filters_active, load_partition_index, sidebar_filters
 from utils.modeling_utils import (
     execute_data_preprocessing,
-    execute_feature_selection,
+    filtered_test_mask,
+    importances_version,
+    load_feature_importances,
     load_models,
     show_model_results
 )
@@ -21,29 +20,17 @@ def run():
   progress = st.progress(0)
   status_text = st.empty()
 
-  # Load data and processing steps with progress bar
-  status_text.text("Loading data...")
-  df = load_data()
-  progress.progress(7)
-
-  status_text.text("Handling missing values...")
-  df = handling_missing_values(df)
-  progress.progress(13)
-
-  status_text.text("Handling outliers...")
-  df = outlier_handling(df)
-  progress.progress(20)
-
-  status_text.text("Extracting features...")
-  df = execute_feature_extraction_operations(df)
+  # Load the transformed data (from the feature store when available) with progress bar
+  status_text.text("Loading transformed data...")
+  dataset = load_transformed_dataset(current_store_version())
   progress.progress(50)
 
   status_text.text("Preprocessing data...")
-  X_train, y_train, X_test, y_test = execute_data_preprocessing(df)
+  X_train, y_train, X_test, y_test = execute_data_preprocessing(dataset)
   progress.progress(60)
 
-  status_text.text("Feature selection...")
-  feature_importances = execute_feature_selection(X_train, y_train)
+  status_text.text("Loading feature importances...")
+  feature_importances = load_feature_importances()
   progress.progress(90)
 
   status_text.text("Loading Models...")
@@ -56,6 +43,17 @@ def run():
   st.success("Loading complete!")
 
   X_test_selected = X_test[models.get("selected_features")]
+  # Names the test rows the results charts are drawn from, so they are cached without hashing predictions
+  test_version = dataset.fingerprint
+
+  filters = sidebar_filters(load_partition_index())
+  if filters_active(filters):
+      # The encoded test set keeps the row order of the raw split, whose station, timestamp and
+      # category columns the filters apply to
+      mask = filtered_test_mask(dataset, **filters)
+      X_test_selected, y_test = X_test_selected[mask], y_test[mask]
+      test_version += f"|{sorted(filters.items())}"
+      st.caption(f"Evaluating on {len(y_test):,} test readings matching the sidebar filters.")
 
   # Sub-navigation inside this page
   sub_page = st.radio(
@@ -65,6 +63,10 @@ def run():
       horizontal=True
   )
 
+  if sub_page != "Preprocessing Steps" and y_test.empty:
+      st.warning("No test readings match the sidebar filters.")
+      return
+
   if sub_page == "Preprocessing Steps":
       st.subheader("📋 Preprocessing Steps Summary")
       st.markdown("""
@@ -87,8 +89,7 @@ def run():
       """)
 
       #plot feature importance
-      fig = plot_top_feature_importance(feature_importances)
-      st.pyplot(fig)
+      show_chart(plot_top_feature_importance, feature_importances, version=importances_version())
 
       #display top feature in table
       top_n = st.slider("Select the number of top features to display", min_value=1, max_value=len(feature_importances), value=10)
@@ -103,10 +104,10 @@ def run():
 
   elif sub_page == "Random Forest":
       st.header("🌲 Random Forest Model")
-      show_model_results(models,"RandomForest", X_test_selected, y_test)
+      show_model_results(models, "RandomForest", X_test_selected, y_test, test_version)
   elif sub_page == "AdaBoost":
       st.header("🚀 AdaBoost Model")
-      show_model_results(models, "AdaBoost", X_test_selected, y_test)
+      show_model_results(models, "AdaBoost", X_test_selected, y_test, test_version)
   elif sub_page == "XGBoost":
       st.header("⚡ XGBoost Model")
-      show_model_results(models, "XGBoost", X_test_selected, y_test)
\ No newline at end of file
+      show_model_results(models, "XGBoost", X_test_selected, y_test, test_version)
\ No newline at end of file
@@ -1,26 +1,16 @@
 import streamlit as st
-from utils.preprocessing import load_data, execute_feature_extraction_operations, handling_missing_values, outlier_handling
+from utils.export import EXPORT_FORMATS, export_reader
+from utils.feature_store import current_store_version, load_transformed_dataset
 
 def run():
   st.title("Transformed Data Overview")
   progress = st.progress(0)
   status_text = st.empty()
 
-  # Load data and processing steps with progress bar
-  status_text.text("Loading data...")
-  df = load_data()
-  progress.progress(20)
-
-  status_text.text("Handling missing values...")
-  df = handling_missing_values(df)
-  progress.progress(40)
-
-  status_text.text("Handling outliers...")
-  df = outlier_handling(df)
-  progress.progress(60)
-
-  status_text.text("Extracting features...")
-  df = execute_feature_extraction_operations(df)
+  # Load the transformed data (from the feature store when available) with progress bar
+  status_text.text("Loading transformed data...")
+  dataset = load_transformed_dataset(current_store_version())
+  df = dataset.data
   progress.progress(100)
 
   # Hide the progress bar by calling st.empty()
@@ -44,11 +34,13 @@ def run():
   - **Pollution Source Estimation**: Additional columns were created to estimate pollution from vehicles (based on PM2.5, PM10, NO2, CO) and industrial sources (based on SO2, O3).
   """)
 
-  # Download the processed dataset
-  csv = df.to_csv(index=False).encode('utf-8')
+  # Download the processed dataset; the file is written on the first click and then reused
+  fmt = st.radio("Download format", list(EXPORT_FORMATS), format_func=lambda key: EXPORT_FORMATS[key][0],
+                 horizontal=True)
+  label, mime, extension = EXPORT_FORMATS[fmt]
   st.download_button(
-      label="📥 Download Cleaned Data as CSV",
-      data=csv,
-      file_name='clean_air_quality_data.csv',
-      mime='text/csv'
+      label=f"📥 Download Cleaned Data as {label}",
+      data=export_reader(dataset, fmt),
+      file_name=f'clean_air_quality_data.{extension}',
+      mime=mime
   )
\ No newline at end of file
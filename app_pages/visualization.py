@@ -1,6 +1,8 @@
 import streamlit as st
 
-from utils.preprocessing import load_data, execute_feature_extraction_operations, handling_missing_values, outlier_handling
+from utils.feature_store import current_store_version, load_transformed_dataset, load_rollups
+from utils.render_cache import show_chart
+from utils.query import filters_active, load_filtered_dataset, load_partition_index, sidebar_filters, slice_rollups
 from utils.plot_utils import (
     plot_average_aqi_per_year,
     plot_stationwise_aqi,
@@ -21,21 +23,20 @@ def run():
   progress = st.progress(0)
   status_text = st.empty()
 
-  # Load data and processing steps with progress bar
-  status_text.text("Loading data...")
-  df = load_data()
-  progress.progress(20)
-
-  status_text.text("Handling missing values...")
-  df = handling_missing_values(df)
-  progress.progress(40)
-
-  status_text.text("Handling outliers...")
-  df = outlier_handling(df)
-  progress.progress(60)
-
-  status_text.text("Extracting features...")
-  df = execute_feature_extraction_operations(df)
+  # Load the pre-aggregated rollups (from the feature store when available) with progress bar
+  status_text.text("Loading aggregated data...")
+  filters = sidebar_filters(load_partition_index())
+  if filters_active(filters):
+      # Only the partitions that can match the filters are read, and the charts' rollups are built from that slice
+      dataset = load_filtered_dataset(filters)
+      rollups = slice_rollups(dataset) if not dataset.data.empty else None
+      # Charts are cached per version of the data they are drawn from, not by hashing the rollups
+      version = dataset.fingerprint
+  else:
+      dataset = None
+      # One version for the rollups and the chart keys, so a chart is never keyed on a newer store than it was drawn from
+      version = current_store_version()
+      rollups = load_rollups(version)
   progress.progress(100)
 
   # Hide the progress bar by calling st.empty()
@@ -43,6 +44,12 @@ def run():
   status_text.empty()
   st.success("Data Fetch complete!")
 
+  if dataset is not None:
+      if rollups is None:
+          st.warning("No readings match the sidebar filters.")
+          return
+      st.caption(f"Showing {len(dataset.data):,} readings matching the sidebar filters.")
+
   # dropdown for options
   option = st.selectbox(
     "Select Trend to Visualize",
@@ -57,48 +64,47 @@ def run():
 
   if option == "Air Quality Index (AQI) Overview":
       st.subheader("Average AQI per Year")
-      fig1 = plot_average_aqi_per_year(df)
-      st.pyplot(fig1)
+      show_chart(plot_average_aqi_per_year, rollups, version=version)
 
       st.subheader("Average Monthly AQI per Year")
-      fig2 = plot_monthlywise_aqi_per_year(df)
-      st.pyplot(fig2)
+      show_chart(plot_monthlywise_aqi_per_year, rollups, version=version)
 
       st.subheader("Average AQI per Year for Each Station")
-      fig3 = plot_stationwise_aqi(df)
-      st.pyplot(fig3)
+      show_chart(plot_stationwise_aqi, rollups, version=version)
 
   elif option == "Vehicle and Industrial Emissions Impact":
       st.subheader("Yearly Average Pollution Trend")
-      fig4 = plot_yearly_pollution_trend(df)
-      st.pyplot(fig4)
+      show_chart(plot_yearly_pollution_trend, rollups, version=version)
 
       st.subheader("Seasonal Pollution Pattern (Monthly Average)")
-      fig5 = plot_monthly_pollution_pattern(df)
-      st.pyplot(fig5)
+      show_chart(plot_monthly_pollution_pattern, rollups, version=version)
 
       st.subheader("Vehicle vs Industrial Pollution Contribution by Year")
-      fig6 = plot_yearly_pollution_contribution(df)
-      st.pyplot(fig6)
+      show_chart(plot_yearly_pollution_contribution, rollups, version=version)
 
       st.subheader("Pollution Type Contribution by Station and Year")
-      fig7 = plot_pollution_by_station_and_year(df)
-      st.pyplot(fig7)
+      show_chart(plot_pollution_by_station_and_year, rollups, version=version)
 
   elif option == "Impact of Rain":
+      # The scatter plots are the only charts that need the hourly rows
+      if dataset is None:
+          dataset = load_transformed_dataset(version)
+
+      # Bounded rendering: a sampled scatter within the point budget, or a hexbin density of every row
+      render_mode = st.radio("Scatter rendering", ["Sampled points", "Density (hexbin)"], horizontal=True)
+      kind = 'hexbin' if render_mode == "Density (hexbin)" else 'scatter'
+      max_points = st.slider("Point budget", min_value=1_000, max_value=100_000, value=20_000, step=1_000,
+                             disabled=(kind == 'hexbin'))
+
       st.subheader("Rainfall vs AQI")
-      fig8 = plot_rainfall_vs_aqi(df)
-      st.pyplot(fig8)
+      show_chart(plot_rainfall_vs_aqi, dataset, kind, max_points)
 
       st.subheader("Rain Imapact on Pollutions")
-      fig9 = plot_rain_vs_pollution(df)
-      st.pyplot(fig9)
+      show_chart(plot_rain_vs_pollution, dataset, kind, max_points)
 
       st.subheader("Seasonal Patterns of Temperature and Dewpoint")
-      fig10 = plot_seasonal_temp_dewp(df)
-      st.pyplot(fig10)
+      show_chart(plot_seasonal_temp_dewp, rollups, version=version)
 
   elif option == "Correlations Heatmap":
       st.subheader("Correlations Heatmap")
-      fig11 = plot_correlation_heatmap(df)
-      st.pyplot(fig11)
+      show_chart(plot_correlation_heatmap, rollups, version=version)
@@ -0,0 +1,67 @@
+# Compare the per-row `calculate_aqi` apply path with the vectorized AQI engine.
+# Run from the project root: python -m benchmarks.aqi_benchmark --rows 1000000 10000000 50000000
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.preprocessing import AQI_BREAKPOINTS, calculate_aqi, calculate_overall_aqi
+
+
+def make_concentrations(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame()
+    for col, breakpoints in AQI_BREAKPOINTS.items():
+        # cover every band, the gaps between bands and values above the last band
+        values = rng.uniform(0, breakpoints[-1, 1] * 1.05, rows)
+        values[rng.random(rows) < 0.01] = np.nan
+        df[col] = values
+    return df
+
+
+def legacy_aqi(df):
+    # the previous create_aqi_column path: one Series.apply per pollutant, then a row-wise max
+    sub_indices = pd.DataFrame(index=df.index)
+    for col, breakpoints in AQI_BREAKPOINTS.items():
+        bands = [tuple(band) for band in breakpoints]
+        sub_indices[col] = df[col].apply(lambda x: calculate_aqi(x, bands))
+    return sub_indices.max(axis=1).round().to_numpy()
+
+
+def vectorized_aqi(df):
+    return calculate_overall_aqi({col: df[col].to_numpy() for col in AQI_BREAKPOINTS})
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the AQI computation paths.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000, 50_000_000])
+    parser.add_argument('--legacy-max-rows', type=int, default=1_000_000,
+                        help='run the apply path on at most this many rows and extrapolate linearly beyond it')
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'legacy (s)':>14} {'vectorized (s)':>16} {'speedup':>10}  match")
+    for rows in args.rows:
+        df = make_concentrations(rows)
+        new, new_time = timed(vectorized_aqi, df)
+
+        sample = min(rows, args.legacy_max_rows)
+        old, old_time = timed(legacy_aqi, df.iloc[:sample])
+        extrapolated = sample < rows
+        old_time = old_time * rows / sample
+
+        match = np.array_equal(old, new[:sample], equal_nan=True)
+        legacy_label = f"{old_time:.2f}{'*' if extrapolated else ''}"
+        print(f"{rows:>12,} {legacy_label:>14} {new_time:>16.3f} {old_time / new_time:>9.0f}x  {match}")
+
+    print("* extrapolated from --legacy-max-rows rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Bytes per row and pipeline time of the default representation (float64, int64, strings) against
+# the compact one (float32, small integers, categoricals), from the CSV to the XGBoost DMatrix.
+# Run from the project root: python -m benchmarks.dtype_benchmark
+import argparse
+import time
+
+import numpy as np
+import xgboost as xgb
+
+from utils.dataset import DatasetHandle
+from utils.model_registry import MODEL_DIR, load_selected_features, load_xgboost
+from utils.modeling_utils import adding_lag_feature, apply_preprocessor, fit_preprocessor, splitting_data_set
+from utils.preprocessing import (
+    execute_feature_extraction_operations,
+    handling_missing_values,
+    load_data,
+    outlier_handling
+)
+
+MODES = {'default': False, 'compact': True}
+
+
+def bytes_per_row(df):
+    return df.memory_usage(deep=True, index=True).sum() / len(df)
+
+
+def run_mode(compact, preprocessor=None):
+    timings = {}
+    sizes = {}
+
+    start = time.perf_counter()
+    raw = load_data.__wrapped__(compact)
+    timings['load'] = time.perf_counter() - start
+    sizes['raw'] = bytes_per_row(raw)
+
+    start = time.perf_counter()
+    df = outlier_handling.__wrapped__(handling_missing_values.__wrapped__(raw))
+    del raw
+    df = execute_feature_extraction_operations.__wrapped__(df)
+    timings['transform'] = time.perf_counter() - start
+    sizes['transformed'] = bytes_per_row(df)
+
+    start = time.perf_counter()
+    lagged = adding_lag_feature.__wrapped__(DatasetHandle(df, f"benchmark-{compact}"))
+    X_train, _, X_test, _ = splitting_data_set.__wrapped__(DatasetHandle(lagged, f"benchmark-{compact}", ('lagged',)))
+    # Both modes are scaled with the same fitted preprocessor, as the saved models expect
+    preprocessor = preprocessor or fit_preprocessor(X_train)
+    X_train = apply_preprocessor(X_train, preprocessor)
+    X_test = apply_preprocessor(X_test, preprocessor)
+    timings['preprocess'] = time.perf_counter() - start
+    sizes['X_train'] = bytes_per_row(X_train)
+
+    start = time.perf_counter()
+    dtest = xgb.DMatrix(X_test[load_selected_features(MODEL_DIR)])
+    timings['dmatrix'] = time.perf_counter() - start
+
+    dtypes = sorted({str(dtype) for dtype in X_train.dtypes})
+    return timings, sizes, dtypes, preprocessor, dtest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per mode; the fastest is reported')
+    args = parser.parse_args()
+
+    booster = load_xgboost(MODEL_DIR)
+    preprocessor = None
+    results = {}
+    for mode, compact in MODES.items():
+        runs = []
+        for _ in range(args.repeat):
+            timings, sizes, dtypes, preprocessor, dtest = run_mode(compact, preprocessor)
+            runs.append(timings)
+        best = {stage: min(run[stage] for run in runs) for stage in runs[0]}
+        results[mode] = (best, sizes, dtypes, booster.predict(dtest))
+
+    print(f"{'mode':>8} {'raw B/row':>10} {'transformed B/row':>18} {'X_train B/row':>14} "
+          f"{'load (s)':>9} {'transform (s)':>14} {'preprocess (s)':>15} {'DMatrix (s)':>12}")
+    for mode, (timings, sizes, _, _) in results.items():
+        print(f"{mode:>8} {sizes['raw']:>10.1f} {sizes['transformed']:>18.1f} {sizes['X_train']:>14.1f} "
+              f"{timings['load']:>9.3f} {timings['transform']:>14.3f} {timings['preprocess']:>15.3f} "
+              f"{timings['dmatrix']:>12.3f}")
+    for mode, (_, _, dtypes, _) in results.items():
+        print(f"{mode} X_train dtypes: {', '.join(dtypes)}")
+
+    diff = np.abs(results['default'][3] - results['compact'][3])
+    print(f"XGBoost predictions, compact vs default: max abs diff {diff.max():.4f}, mean {diff.mean():.5f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Time of the grouped NumPy feature library against one pandas groupby call per feature (shift,
+# rolling, ewm), for growing slices of the forecasting spec, and the largest difference between the two.
+# Run from the project root: python -m benchmarks.feature_benchmark --repeat 3
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.feature_store import current_store_version, load_transformed_data
+from utils.features import FORECAST_FEATURE_SPEC, build_features, feature_names
+
+
+def legacy_features(df, spec):
+    # One groupby pass per feature over the station/time sorted frame, as adding_lag_feature did for its two lags
+    df = df.reset_index().sort_values(['station', 'timestamp'], kind='stable')
+    grouped = df.groupby('station', sort=False, observed=True)
+    features = pd.DataFrame(index=df.index)
+
+    for col, lags in spec.get('lag', {}).items():
+        for k in lags:
+            features[f"{col}_lag{k}"] = grouped[col].shift(k)
+    for col, rolling in spec.get('rolling', {}).items():
+        for window in rolling['windows']:
+            for stat in rolling['stats']:
+                values = grouped[col].rolling(window, min_periods=1).agg(stat)
+                features[f"{col}_roll{window}_{stat}"] = values.reset_index(level=0, drop=True)
+    for col, half_lives in spec.get('decay', {}).items():
+        position = grouped.cumcount().to_numpy()
+        for half_life in half_lives:
+            # ewm gives the weighted mean; times the total weight it is the decayed sum
+            factor = 0.5 ** (1 / half_life)
+            weights = (1 - factor ** (position + 1)) / (1 - factor)
+            features[f"{col}_decay{half_life}"] = grouped[col].transform(
+                lambda s: s.ewm(halflife=half_life).mean()).to_numpy() * weights
+
+    return features.sort_index()
+
+
+def sub_spec(spec, count):
+    # The first `count` features of the spec, in feature_names order
+    keep = set(feature_names(spec)[:count])
+    lag = {col: [k for k in lags if f"{col}_lag{k}" in keep] for col, lags in spec.get('lag', {}).items()}
+    rolling = {}
+    for col, entry in spec.get('rolling', {}).items():
+        windows = [w for w in entry['windows'] if any(f"{col}_roll{w}_{stat}" in keep for stat in entry['stats'])]
+        stats = [stat for stat in entry['stats'] if any(f"{col}_roll{w}_{stat}" in keep for w in windows)]
+        rolling[col] = {'windows': windows, 'stats': stats}
+    decay = {col: [h for h in half_lives if f"{col}_decay{h}" in keep]
+             for col, half_lives in spec.get('decay', {}).items()}
+    return {'lag': {col: lags for col, lags in lag.items() if lags},
+            'rolling': {col: entry for col, entry in rolling.items() if entry['windows']},
+            'decay': {col: half_lives for col, half_lives in decay.items() if half_lives}}
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per size; the fastest is reported')
+    args = parser.parse_args()
+
+    df = load_transformed_data.__wrapped__(current_store_version())
+    total = len(feature_names(FORECAST_FEATURE_SPEC))
+
+    print(f"{len(df)} rows, {df['station'].nunique()} stations")
+    print(f"{'features':>9} {'groupby (s)':>12} {'library (s)':>12} {'speedup':>8} {'max abs diff':>13}")
+    for count in sorted({2, 8, total // 2, total}):
+        spec = sub_spec(FORECAST_FEATURE_SPEC, count)
+        legacy_seconds, legacy = best_time(lambda: legacy_features(df, spec), args.repeat)
+        seconds, features = best_time(lambda: build_features(df, spec), args.repeat)
+        diff = np.nanmax(np.abs(features.to_numpy(dtype=float) - legacy[features.columns].to_numpy(dtype=float)))
+        print(f"{count:>9} {legacy_seconds:>12.3f} {seconds:>12.3f} {legacy_seconds / seconds:>7.1f}x {diff:>13.2e}")
+
+    # Lagged rain effect: correlation of AQI with rain features across the forecasting spec
+    features = build_features(df, FORECAST_FEATURE_SPEC).reset_index(drop=True)
+    rain = [name for name in features.columns if name.startswith('RAIN')]
+    correlations = features[rain].corrwith(df['AQI'].reset_index(drop=True))
+    print("Correlation of AQI with rain features:")
+    for name, value in correlations.items():
+        print(f"  {name:<18} {value:+.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# Compare the dashboard's previous feature selection (a default RandomForestRegressor on the whole
+# training split) with the cheaper importance methods, and optionally persist one of them with the models.
+# Run from the project root: python -m benchmarks.feature_importance_benchmark --save legacy
+import argparse
+import time
+
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from utils.modeling_utils import (
+    IMPORTANCE_SAMPLE_ROWS,
+    compute_feature_importances,
+    load_models,
+    load_training_features,
+    save_feature_importances
+)
+
+METHODS = ['legacy', 'forest', 'xgb_gain']
+
+
+def legacy_importances(X_train, y_train):
+    # the previous execute_feature_selection: 100 trees, single-threaded, every training row
+    model = RandomForestRegressor()
+    model.fit(X_train, y_train)
+    importance_df = pd.DataFrame({'Feature': X_train.columns, 'Importance': model.feature_importances_})
+    return importance_df.sort_values(by='Importance', ascending=False)
+
+
+def ranking_agreement(reference, candidate, top_n):
+    ranks = pd.concat([reference.set_index('Feature')['Importance'].rank(ascending=False),
+                       candidate.set_index('Feature')['Importance'].rank(ascending=False)], axis=1, join='inner')
+    spearman = ranks.corr(method='spearman').iloc[0, 1]
+    overlap = len(set(reference['Feature'].head(top_n)) & set(candidate['Feature'].head(top_n)))
+    return spearman, overlap
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the feature importance methods.')
+    parser.add_argument('--sample-rows', type=int, default=IMPORTANCE_SAMPLE_ROWS,
+                        help='training rows the parallel forest is fitted on')
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--save', choices=METHODS, help='persist this method\'s importances next to the models')
+    args = parser.parse_args()
+
+    X_train, y_train = load_training_features()
+    booster = load_models()['XGBoost']
+
+    results = {}
+    timings = {}
+    for method in METHODS:
+        start = time.perf_counter()
+        if method == 'legacy':
+            results[method] = legacy_importances(X_train, y_train)
+        else:
+            results[method] = compute_feature_importances(X_train, y_train, method, args.sample_rows, booster)
+        timings[method] = time.perf_counter() - start
+
+    print(f"{len(X_train):,} training rows, {X_train.shape[1]} features")
+    print(f"{'method':>10} {'time (s)':>10} {'speedup':>9} {'spearman':>9} {f'top-{args.top_n}':>7}")
+    for method in METHODS:
+        spearman, overlap = ranking_agreement(results['legacy'], results[method], args.top_n)
+        print(f"{method:>10} {timings[method]:>10.2f} {timings['legacy'] / timings[method]:>8.1f}x "
+              f"{spearman:>9.3f} {overlap:>4}/{args.top_n}")
+    print("xgb_gain only scores the features the booster was trained on; the rest tie at 0")
+
+    if args.save:
+        save_feature_importances(results[args.save], args.save)
+        print(f"Saved {args.save} importances")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Memory held by N worker processes that each load the transformed data and the preprocessed
+# train/test split, with private copies (the previous path) or attached to the shared Arrow files.
+# Run from the project root: python -m benchmarks.shared_memory_benchmark --workers 1 2 4 8
+import argparse
+import multiprocessing
+import time
+
+from utils.dataset import DatasetHandle
+from utils.feature_store import feature_store_key, load_transformed_data, read_store, store_version
+from utils.modeling_utils import (
+    adding_lag_feature,
+    apply_preprocessor,
+    execute_data_preprocessing,
+    load_preprocessor,
+    splitting_data_set
+)
+
+MODES = ['private', 'shared']
+
+
+def memory_mib():
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(':', 1) for line in f)
+    return {name: int(fields[name].split()[0]) / 1024 for name in ['RssAnon', 'RssFile']}
+
+
+def load_private():
+    # Previous path: every process reads the store and preprocesses its own copy
+    df = read_store(feature_store_key())
+    lagged = adding_lag_feature.__wrapped__(DatasetHandle(df, 'private'))
+    X_train, y_train, X_test, y_test = splitting_data_set.__wrapped__(DatasetHandle(lagged, 'private', ('lagged',)))
+    preprocessor = load_preprocessor.__wrapped__()
+    return df, apply_preprocessor(X_train, preprocessor), y_train, apply_preprocessor(X_test, preprocessor), y_test
+
+
+def load_shared():
+    version = store_version(feature_store_key())
+    df = load_transformed_data.__wrapped__(version)
+    dataset = DatasetHandle(df, version, ('transformed',))
+    return (df,) + execute_data_preprocessing.__wrapped__(dataset)
+
+
+def worker(mode, barrier, results):
+    before = memory_mib()
+    start = time.perf_counter()
+    frames = load_private() if mode == 'private' else load_shared()
+    seconds = time.perf_counter() - start
+    # Touch every column, as a session rendering pages and scoring models would
+    for frame in frames:
+        frame.sum(numeric_only=True) if hasattr(frame, 'columns') else frame.sum()
+    after = memory_mib()
+    results.append({'seconds': seconds, **{name: after[name] - before[name] for name in after}})
+    # Every worker keeps its frames until all of them are measured
+    barrier.wait()
+
+
+def run(mode, workers):
+    context = multiprocessing.get_context('spawn')
+    manager = context.Manager()
+    barrier, results = manager.Barrier(workers), manager.list()
+    processes = [context.Process(target=worker, args=(mode, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return list(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    # Publish the shared files once, so the shared runs measure attaching rather than building
+    load_shared()
+
+    print(f"{'mode':>8} {'workers':>8} {'private MiB/worker':>19} {'private MiB total':>18} "
+          f"{'file-backed MiB/worker':>23} {'load (s)':>9}")
+    for workers in args.workers:
+        for mode in MODES:
+            results = run(mode, workers)
+            private = [result['RssAnon'] for result in results]
+            file_backed = [result['RssFile'] for result in results]
+            seconds = max(result['seconds'] for result in results)
+            print(f"{mode:>8} {workers:>8} {sum(private) / workers:>19.1f} {sum(private):>18.1f} "
+                  f"{sum(file_backed) / workers:>23.1f} {seconds:>9.2f}")
+    print("File-backed pages of the shared Arrow files are one copy in the page cache for all workers")
+
+
+if __name__ == '__main__':
+    main()
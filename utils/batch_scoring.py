@@ -0,0 +1,142 @@
+import argparse
+import copy
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xgboost as xgb
+
+from utils.modeling_utils import apply_preprocessor, load_models, load_preprocessor
+
+MODEL_NAMES = ['RandomForest', 'AdaBoost', 'XGBoost']
+BATCH_SIZE = 100_000
+
+
+def iter_input_batches(path, batch_size=BATCH_SIZE):
+    if path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(path)
+        batches = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=batch_size))
+    else:
+        batches = pd.read_csv(path, chunksize=batch_size)
+
+    for batch in batches:
+        # Feature store files keep `timestamp` as the index
+        yield batch.reset_index() if batch.index.name == 'timestamp' else batch
+
+
+def add_lag_features(batch, last_rows):
+  # Same lags as adding_lag_feature, carried across batches through the previous batch's last row
+  # per station. Rows are expected in time order within each station, as adding_lag_feature sorts them.
+  previous = pd.DataFrame.from_dict(last_rows, orient='index', columns=['PM2.5', 'AQI'], dtype=float)
+  previous = previous[previous.index.isin(batch['station'].unique())]
+  previous['station'] = previous.index
+
+  history = pd.concat([previous[['station', 'PM2.5', 'AQI']], batch[['station', 'PM2.5', 'AQI']]], ignore_index=True)
+  shifted = history.groupby('station', sort=False)[['PM2.5', 'AQI']].shift(1).iloc[len(previous):]
+
+  batch = batch.copy()
+  batch['PM2.5_lag1'] = shifted['PM2.5'].to_numpy()
+  batch['AQI_lag1'] = shifted['AQI'].to_numpy()
+
+  for station, row in batch.groupby('station', sort=False)[['PM2.5', 'AQI']].last().iterrows():
+      last_rows[station] = (row['PM2.5'], row['AQI'])
+
+  return batch
+
+
+def with_threads(model, threads):
+    # A private copy with its own thread count, since the registry's models are shared with every
+    # session in the process. The sklearn copy is shallow, so the fitted trees aren't duplicated
+    if isinstance(model, xgb.Booster):
+        model = model.copy()
+        model.set_param({'nthread': threads})
+    elif hasattr(model, 'n_jobs'):
+        model = copy.copy(model)
+        model.n_jobs = threads
+    return model
+
+
+def predict_batch(models, model_names, X):
+    predictions = {}
+    timings = {}
+
+    for name in model_names:
+        start = time.perf_counter()
+        if name == 'XGBoost':
+            predictions[name] = models[name].inplace_predict(X)
+        else:
+            predictions[name] = models[name].predict(X)
+        timings[name] = time.perf_counter() - start
+
+    return predictions, timings
+
+
+def score_file(input_path, output_path, model_names=MODEL_NAMES, batch_size=BATCH_SIZE, threads=None):
+    threads = threads or os.cpu_count()
+    registry = load_models()
+    preprocessor = load_preprocessor()
+    selected_features = registry['selected_features']
+
+    # Multi-threaded prediction: XGBoost's own thread pool, joblib workers for the sklearn ensembles
+    models = {name: with_threads(registry[name], threads) for name in model_names}
+
+    last_rows = {}
+    writer = None
+    rows_in = rows_out = 0
+    model_time = dict.fromkeys(model_names, 0.0)
+    start = time.perf_counter()
+
+    try:
+        for batch in iter_input_batches(input_path, batch_size):
+            rows_in += len(batch)
+
+            # Rows without a previous reading for their station have no lags, as in adding_lag_feature
+            batch = add_lag_features(batch, last_rows).dropna()
+            if batch.empty:
+                continue
+
+            X = apply_preprocessor(batch, preprocessor, selected_features)
+            predictions, timings = predict_batch(models, model_names, X)
+
+            output = pd.DataFrame({col: batch[col].to_numpy() for col in ['timestamp', 'station', 'AQI'] if col in batch})
+            for name in model_names:
+                output[f"pred_{name}"] = np.asarray(predictions[name], dtype='float32')
+                model_time[name] += timings[name]
+
+            table = pa.Table.from_pandas(output, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+            rows_out += len(output)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'input': input_path,
+        'output': output_path,
+        'rows_in': rows_in,
+        'rows_scored': rows_out,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows_out / elapsed, 1) if elapsed else None,
+        'model_rows_per_sec': {name: round(rows_out / t, 1) if t else None for name, t in model_time.items()},
+        'threads': threads,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score a transformed air quality file with the saved AQI models.')
+    parser.add_argument('input', help='CSV or Parquet file with the transformed feature columns')
+    parser.add_argument('output', help='Parquet file to write predictions to')
+    parser.add_argument('--models', nargs='+', choices=MODEL_NAMES, default=MODEL_NAMES)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--threads', type=int, default=None, help='prediction threads (default: all cores)')
+    args = parser.parse_args()
+
+    report = score_file(args.input, args.output, args.models, args.batch_size, args.threads)
+    print(json.dumps(report, indent=2))
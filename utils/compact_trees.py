@@ -0,0 +1,157 @@
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+
+from utils.model_registry import MODEL_DIR, SOURCE_FILES, file_signature, load_ada_boost, load_random_forest
+
+COMPACT_FILES = {
+    'RandomForest': "random_forest_compact.pkl",
+    'AdaBoost': "ada_boost_compact.pkl",
+}
+PREDICT_BATCH_ROWS = 8_192
+
+
+def float32_thresholds(thresholds):
+    # sklearn compares float32 inputs against float64 thresholds. Rounding each threshold down to the
+    # nearest float32 keeps `x <= threshold` exact for every float32 x
+    rounded = thresholds.astype(np.float32)
+    too_high = rounded.astype(np.float64) > thresholds
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+class CompactTreeEnsemble:
+    # Every tree's nodes in the same contiguous arrays. Leaves point back to themselves, so a
+    # fixed number of vectorized steps walks all (row, tree) pairs to their leaves at once
+    def __init__(self, estimators, kind, estimator_weights=None, feature_names=None):
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        offset = 0
+
+        for estimator in estimators:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left < 0
+
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            value.append(tree.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree.node_count
+
+        self.kind = kind
+        self.feature = np.concatenate(feature).astype(np.int16)
+        self.threshold = float32_thresholds(np.concatenate(threshold))
+        # children[2 * node] is the left child and children[2 * node + 1] the right one
+        self.children = np.column_stack([np.concatenate(left), np.concatenate(right)]).ravel().astype(np.int32)
+        self.value = np.concatenate(value).astype(np.float32)
+        self.roots = np.array(roots, dtype=np.int32)
+        self.depth = max(estimator.tree_.max_depth for estimator in estimators)
+        self.estimator_weights = None if estimator_weights is None else np.asarray(estimator_weights, dtype=np.float64)
+        self.feature_names_in_ = None if feature_names is None else np.asarray(feature_names, dtype=object)
+        # Signature of the sklearn pickle this was exported from, checked by the model registry
+        self.source = None
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ['feature', 'threshold', 'children', 'value', 'roots'])
+
+    def leaf_values(self, X):
+        n_rows, n_features = X.shape
+        X = X.ravel()
+        nodes = np.tile(self.roots, n_rows)
+        row_offsets = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, len(self.roots))
+
+        for _ in range(self.depth):
+            goes_right = X.take(row_offsets + self.feature.take(nodes)) > self.threshold.take(nodes)
+            nodes = self.children.take(2 * nodes + goes_right)
+
+        return self.value.take(nodes).astype(np.float64).reshape(n_rows, len(self.roots))
+
+    def combine(self, predictions):
+        if self.kind == 'forest':
+            return predictions.mean(axis=1)
+
+        # AdaBoostRegressor: the weighted median of the estimator predictions
+        sorted_idx = np.argsort(predictions, axis=1)
+        weight_cdf = np.cumsum(self.estimator_weights[sorted_idx], axis=1)
+        median_idx = (weight_cdf >= 0.5 * weight_cdf[:, -1][:, None]).argmax(axis=1)
+        rows = np.arange(len(predictions))
+        return predictions[rows, sorted_idx[rows, median_idx]]
+
+    def predict(self, X):
+        if self.feature_names_in_ is not None and hasattr(X, 'columns'):
+            X = X[list(self.feature_names_in_)]
+        X = np.ascontiguousarray(X, dtype=np.float32)
+
+        # Bounded batches keep the (rows, trees) node matrix small
+        return np.concatenate([self.combine(self.leaf_values(X[start:start + PREDICT_BATCH_ROWS]))
+                               for start in range(0, len(X), PREDICT_BATCH_ROWS)] or [np.empty(0)])
+
+
+def compact_forest(model):
+    return CompactTreeEnsemble(model.estimators_, 'forest', feature_names=getattr(model, 'feature_names_in_', None))
+
+
+def compact_ada_boost(model):
+    n_estimators = len(model.estimators_)
+    return CompactTreeEnsemble(model.estimators_, 'adaboost', model.estimator_weights_[:n_estimators],
+                               getattr(model, 'feature_names_in_', None))
+
+
+def save_compact_model(compact_model, model_dir, name):
+    compact_model.source = file_signature(os.path.join(model_dir, SOURCE_FILES[name]))
+    path = os.path.join(model_dir, COMPACT_FILES[name])
+    tmp_path = f"{path}.tmp"
+    # Uncompressed, so the registry can memory-map the node arrays
+    joblib.dump(compact_model, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def export_compact_models(model_dir=MODEL_DIR, rows=10_000, seed=42):
+    report = {}
+
+    for name, load, compact in [('RandomForest', load_random_forest, compact_forest),
+                                ('AdaBoost', load_ada_boost, compact_ada_boost)]:
+        model = load(model_dir)
+        compact_model = compact(model)
+
+        path = save_compact_model(compact_model, model_dir, name)
+
+        # The features are standardized, so standard normal inputs exercise both sides of the splits
+        X = np.random.default_rng(seed).standard_normal((rows, model.n_features_in_)).astype(np.float32)
+        start = time.perf_counter()
+        expected = model.predict(X)
+        sklearn_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        predicted = compact_model.predict(X)
+        compact_seconds = time.perf_counter() - start
+
+        report[name] = {
+            'nodes': len(compact_model.feature),
+            'array_mib': round(compact_model.nbytes / 2**20, 2),
+            'file_mib': round(os.path.getsize(path) / 2**20, 2),
+            'max_abs_diff': float(np.max(np.abs(expected - predicted))),
+            'sklearn_rows_per_sec': round(rows / sklearn_seconds),
+            'compact_rows_per_sec': round(rows / compact_seconds),
+        }
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the tree ensembles to the compact flat-array format.')
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--rows', type=int, default=10_000, help='rows used to check the export against sklearn')
+    args = parser.parse_args()
+
+    # Export through the importable module, so the pickles reference utils.compact_trees and not __main__
+    from utils.compact_trees import export_compact_models
+
+    for name, stats in export_compact_models(args.model_dir, args.rows).items():
+        print(name, stats)
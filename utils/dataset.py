@@ -0,0 +1,81 @@
+import functools
+import hashlib
+
+import pandas as pd
+import streamlit as st
+
+from utils.profiling import profiled, profiled_cache
+
+# Shared stage results rely on Copy-on-Write, the default from pandas 3
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# What a pipeline stage hands back relative to its input:
+# 'new'  - rewrites column data or reorders rows, so the cache entry owns freshly allocated buffers
+# 'view' - only adds, drops or relabels columns, sharing every other buffer with its input
+STAGE_RETURNS = ('new', 'view')
+# Entries kept per shared stage, e.g. the current and the previous dataset version while sessions
+# move over after an append; older entries are evicted instead of pinning their frames for good
+SHARED_STAGE_MAX_ENTRIES = 4
+
+
+# A dataset plus a precomputed fingerprint (source hash and the stages applied to it), so cached
+# stages can be keyed in O(1) instead of st.cache_data hashing every row of the frame
+class DatasetHandle:
+    def __init__(self, data, source, lineage=()):
+        self.data = data
+        self.source = source
+        self.lineage = tuple(lineage)
+        self.fingerprint = hashlib.sha256("|".join((source,) + self.lineage).encode()).hexdigest()
+
+    def derive(self, stage, data):
+        return DatasetHandle(data, self.source, self.lineage + (stage,))
+
+    def __repr__(self):
+        return f"DatasetHandle({' -> '.join((self.source[:12],) + self.lineage)})"
+
+
+def dataset_fingerprint(handle):
+    return handle.fingerprint
+
+
+def cache_stage(func=None, **kwargs):
+    # st.cache_data that hashes DatasetHandle arguments by fingerprint only, recorded as a profiled stage
+    hash_funcs = {DatasetHandle: dataset_fingerprint, **kwargs.pop('hash_funcs', {})}
+    decorate = profiled_cache(st.cache_data, hash_funcs=hash_funcs, **kwargs)
+    return decorate if func is None else decorate(func)
+
+
+def share(value):
+    # A shallow Copy-on-Write copy: no data is copied, and a caller writing to it only copies the
+    # columns it touches, so the cached object itself stays read-only
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, tuple):
+        return tuple(share(item) for item in value)
+    return value
+
+
+def shared_stage(returns, **kwargs):
+    # Caches with st.cache_resource, so a hit returns the cached frame instead of unpickling a full
+    # copy the way st.cache_data does, and hands it out through `share`. Stages must not modify their
+    # input frames, which may be another stage's cached result
+    if returns not in STAGE_RETURNS:
+        raise ValueError(f"returns must be one of {STAGE_RETURNS}, got {returns!r}")
+    hash_funcs = {DatasetHandle: dataset_fingerprint, **kwargs.pop('hash_funcs', {})}
+    kwargs.setdefault('max_entries', SHARED_STAGE_MAX_ENTRIES)
+
+    def decorate(func):
+        cached = profiled_cache(st.cache_resource, hash_funcs=hash_funcs, **kwargs)(func)
+
+        @functools.wraps(func)
+        def stage(*args, **stage_kwargs):
+            return share(cached(*args, **stage_kwargs))
+
+        stage.clear = cached.clear
+        stage.returns = returns
+        # Profiled without the cache, for pipelines that only keep their final result
+        stage.uncached = profiled(func.__name__)(func)
+        return stage
+
+    return decorate
@@ -0,0 +1,95 @@
+import contextlib
+import gzip
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.feature_store import feature_store_key, feature_store_path
+from utils.profiling import profile_stage
+from utils.shared_data import publish_lock, shared_name
+
+EXPORT_SUBDIR = "exports"
+EXPORT_CHUNK_ROWS = 50_000
+# Exports of other datasets younger than this are kept, as sessions may still be downloading them
+EXPORT_GRACE_SECONDS = 3600
+# label, MIME type and file extension of every download format
+EXPORT_FORMATS = {
+    'csv': ("CSV", "text/csv", "csv"),
+    'csv.gz': ("CSV (gzip)", "application/gzip", "csv.gz"),
+    'parquet': ("Parquet", "application/vnd.apache.parquet", "parquet"),
+}
+
+
+def write_csv(df, f, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Chunk by chunk, so only one chunk's text is in memory instead of the whole file and a bytes copy
+    for start in range(0, len(df), chunk_rows):
+        df.iloc[start:start + chunk_rows].to_csv(f, header=(start == 0), index=False)
+    if not len(df):
+        df.to_csv(f, index=False)
+
+
+def write_parquet(df, path, chunk_rows=EXPORT_CHUNK_ROWS):
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for start in range(0, max(len(df), 1), chunk_rows):
+            writer.write_table(pa.Table.from_pandas(df.iloc[start:start + chunk_rows], schema=schema,
+                                                    preserve_index=False))
+
+
+def write_export(df, path, fmt):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if fmt == 'parquet':
+        write_parquet(df, tmp_path)
+    elif fmt == 'csv.gz':
+        # Level 6 is gzip's default trade-off; the CSV compresses several times over either way
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', newline='', compresslevel=6) as f:
+            write_csv(df, f)
+    else:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            write_csv(df, f)
+    os.replace(tmp_path, path)
+
+
+def remove_stale_exports(directory, keep, grace_seconds=EXPORT_GRACE_SECONDS):
+    # In-flight temporary files belong to writers in other processes, and recent exports may be in use
+    cutoff = time.time() - grace_seconds
+    for name in os.listdir(directory):
+        if name.startswith(keep) or name.endswith('.lock') or '.tmp-' in name:
+            continue
+        path = os.path.join(directory, name)
+        with contextlib.suppress(FileNotFoundError):
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+
+def export_path(dataset, fmt):
+    # Written once per dataset fingerprint and format, then reused by every session and worker
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"fmt must be one of {tuple(EXPORT_FORMATS)}, got {fmt!r}")
+
+    directory = os.path.join(feature_store_path(feature_store_key()), EXPORT_SUBDIR)
+    os.makedirs(directory, exist_ok=True)
+    name = shared_name('clean_air_quality', dataset.fingerprint)
+    path = os.path.join(directory, f"{name}.{EXPORT_FORMATS[fmt][2]}")
+
+    if not os.path.exists(path):
+        with publish_lock(directory, name):
+            if not os.path.exists(path):
+                with profile_stage(f"export[{fmt}]", len(dataset.data)):
+                    write_export(dataset.data, path, fmt)
+                remove_stale_exports(directory, name)
+    return path
+
+
+def export_reader(dataset, fmt):
+    # For st.download_button: nothing is generated or read until the button is clicked. The open file
+    # is handed to Streamlit to read, and stays readable if another process evicts the export meanwhile
+    def read():
+        try:
+            return open(export_path(dataset, fmt), 'rb')
+        except FileNotFoundError:
+            # Evicted between export_path and open: export_path writes it again
+            return open(export_path(dataset, fmt), 'rb')
+    return read
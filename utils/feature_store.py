@@ -0,0 +1,330 @@
+import streamlit as st
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import hashlib
+import json
+import os
+import time
+
+from utils import preprocessing, parallel_extraction
+from utils.parallel_extraction import execute_feature_extraction_operations_parallel
+from utils.rollups import build_rollups
+from utils.dataset import SHARED_STAGE_MAX_ENTRIES, DatasetHandle, shared_stage
+from utils.profiling import profiled_cache
+from utils.shared_data import SHARED_DIR, SHARED_SUBDIR, shared_frames, shared_name
+from utils.preprocessing import (
+    DATA_PATH,
+    load_data,
+    handling_missing_values,
+    outlier_handling,
+    execute_feature_extraction_operations
+)
+
+FEATURE_STORE_DIR = os.path.join("data", "feature_store")
+TRANSFORMED_FILE = "transformed.parquet"
+META_FILE = "meta.json"
+TAIL_FILE = "tail.parquet"
+ROLLUP_FILES = {'cube': "rollup_cube.parquet", 'moments': "rollup_moments.parquet"}
+DELTA_DIR = "deltas"
+DIGEST_CACHE_FILE = "digests.json"
+# Trailing rows kept per station, enough to extend the 24h windows and lags on append
+TAIL_ROWS = 23
+# Bumped whenever the set of files a store holds or their format changes, so stores written by older
+# code get a new key (3: pairwise correlation moments)
+STORE_LAYOUT_VERSION = 3
+# Key suffix of stores whose rolling windows restart at each station
+PER_STATION_SUFFIX = "-per-station"
+# Appends fold their delta files into the base file once this many have accumulated
+COMPACT_AFTER_DELTAS = int(os.environ.get("AQI_COMPACT_AFTER_DELTAS", "32"))
+# Parquet metadata naming the last delta file a compacted base file already holds
+COMPACTED_THROUGH = b"aqi.compacted_through"
+
+# Worker processes for per-station feature extraction; 1 keeps the single-frame pipeline
+FEATURE_WORKERS = int(os.environ.get("AQI_FEATURE_WORKERS", "1"))
+
+
+def file_digest(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def source_digest(path=DATA_PATH):
+    # Re-hashing a large CSV on every start is wasteful, so remember the digest per (size, mtime)
+    stat = os.stat(path)
+    signature = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    cache_path = os.path.join(FEATURE_STORE_DIR, DIGEST_CACHE_FILE)
+
+    digests = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            digests = json.load(f)
+
+    if signature not in digests:
+        digests[signature] = file_digest(path)
+        os.makedirs(FEATURE_STORE_DIR, exist_ok=True)
+        write_json_atomic(cache_path, digests)
+
+    return digests[signature]
+
+
+def pipeline_code_version():
+    # Any change to the preprocessing code invalidates every stored dataset
+    sha = hashlib.sha256()
+    for module in (preprocessing, parallel_extraction):
+        with open(module.__file__, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def feature_store_key(path=DATA_PATH):
+    key = f"{source_digest(path)[:16]}-{pipeline_code_version()[:12]}-s{STORE_LAYOUT_VERSION}"
+
+    # Per-station extraction restarts the rolling windows at each station, so it is stored separately
+    if FEATURE_WORKERS > 1:
+        key += PER_STATION_SUFFIX
+    if preprocessing.COMPACT_DTYPES:
+        key += "-compact"
+
+    return key
+
+
+def feature_store_path(key):
+    return os.path.join(FEATURE_STORE_DIR, key)
+
+
+def per_station_windows(key):
+    return PER_STATION_SUFFIX in key
+
+
+def shared_path(key):
+    return os.path.join(SHARED_DIR, key) if SHARED_DIR else os.path.join(feature_store_path(key), SHARED_SUBDIR)
+
+
+def run_transformation_pipeline():
+    # Only the stored result is kept, so the CSV is read and every stage runs without the stage caches,
+    # and each intermediate frame is released as soon as the next stage has consumed it. Returns the
+    # transformed frame and the cleaning parameters fitted on the raw rows
+    df = load_data.uncached()
+    cleaning_params = fit_cleaning_params(df)
+    df = handling_missing_values.uncached(df)
+    df = outlier_handling.uncached(df)
+
+    if FEATURE_WORKERS > 1:
+        df = execute_feature_extraction_operations_parallel(df, max_workers=FEATURE_WORKERS)
+    else:
+        df = execute_feature_extraction_operations.uncached(df)
+
+    return df, cleaning_params
+
+
+def write_json_atomic(path, payload):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def write_parquet_atomic(df, path, metadata=None):
+    # Write to a temporary file first so a concurrent reader never sees a partial dataset
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if metadata:
+        table = pa.Table.from_pandas(df)
+        pq.write_table(table.replace_schema_metadata({**table.schema.metadata, **metadata}), tmp_path)
+    else:
+        df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def fit_cleaning_params(raw):
+    # The imputation values and clip bounds the pipeline derived from the raw data, kept so that
+    # rows appended later are cleaned the same way (same layout as streaming_cleaning.apply_cleaning)
+    numerical_cols = raw.select_dtypes(include=['number']).columns
+    means = raw[numerical_cols].mean()
+
+    categorical_cols = raw.select_dtypes(include=['object', 'string', 'category']).columns
+    modes = {col: raw[col].mode().iloc[0] for col in categorical_cols}
+
+    winsorized_cols = [col for col in numerical_cols if col not in ['No', 'year', 'month', 'day', 'hour']]
+    imputed = raw[winsorized_cols].fillna(means[winsorized_cols])
+    bounds = {col: (float(imputed[col].quantile(0.01)), float(imputed[col].quantile(0.99))) for col in winsorized_cols}
+
+    return {'means': {col: float(v) for col, v in means.items()}, 'modes': modes, 'bounds': bounds}
+
+
+def station_tail(df, rows):
+    return df.groupby('station', sort=False).tail(rows)[['station', 'PM2.5', 'PM10', 'AQI']]
+
+
+def save_transformed_data(df, key, cleaning_params=None, tail_rows=TAIL_ROWS):
+    store_path = feature_store_path(key)
+    os.makedirs(store_path, exist_ok=True)
+
+    write_parquet_atomic(df, os.path.join(store_path, TRANSFORMED_FILE))
+
+    write_parquet_atomic(station_tail(df, tail_rows), os.path.join(store_path, TAIL_FILE))
+
+    save_rollups(build_rollups(df), key)
+
+    write_json_atomic(os.path.join(store_path, META_FILE), {
+        'key': key,
+        'source_path': DATA_PATH,
+        'code_version': pipeline_code_version(),
+        'rows': len(df),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'cleaning': cleaning_params,
+    })
+
+
+def save_rollups(rollups, key):
+    for name, file_name in ROLLUP_FILES.items():
+        write_parquet_atomic(rollups[name], os.path.join(feature_store_path(key), file_name))
+
+
+def read_rollups(key):
+    return {name: pd.read_parquet(os.path.join(feature_store_path(key), file_name))
+            for name, file_name in ROLLUP_FILES.items()}
+
+
+def read_meta(key):
+    with open(os.path.join(feature_store_path(key), META_FILE)) as f:
+        return json.load(f)
+
+
+def build_store(key):
+    # Runs the current pipeline on the source data and stores the result under `key`
+    df, cleaning_params = run_transformation_pipeline()
+    save_transformed_data(df, key, cleaning_params)
+    return df
+
+
+def backfill_append_state(key):
+    # Stores written before appends were supported have no tail file and no cleaning parameters;
+    # both are derived once from the stored rows and the source data, then saved with the store
+    store_path = feature_store_path(key)
+    meta_path = os.path.join(store_path, META_FILE)
+    meta = read_meta(key) if os.path.exists(meta_path) else {'key': key, 'source_path': DATA_PATH}
+
+    tail_path = os.path.join(store_path, TAIL_FILE)
+    if not os.path.exists(tail_path):
+        write_parquet_atomic(station_tail(read_store(key), TAIL_ROWS), tail_path)
+
+    if not meta.get('cleaning'):
+        source_path = meta.get('source_path', DATA_PATH)
+        if not key.startswith(source_digest(source_path)[:16]):
+            raise ValueError(f"{source_path} changed since feature store {key} was built, so its cleaning "
+                             f"parameters can't be refitted; rebuild the store instead")
+        meta['cleaning'] = fit_cleaning_params(pd.read_csv(source_path))
+        write_json_atomic(meta_path, meta)
+
+    return meta
+
+
+def read_store_parts(key):
+    # The stored rows and the delta files read for them
+    store_path = feature_store_path(key)
+    transformed_path = os.path.join(store_path, TRANSFORMED_FILE)
+    version = store_version(key)
+
+    # Rows appended incrementally live in small delta files until the store is compacted; those a
+    # compacted base file already holds are skipped in case their removal hasn't finished
+    through = compacted_through(key)
+    df = pd.read_parquet(transformed_path)
+    parts = [name for name in delta_parts(key) if name > through]
+    try:
+        if parts:
+            delta_dir = os.path.join(store_path, DELTA_DIR)
+            df = pd.concat([df] + [pd.read_parquet(os.path.join(delta_dir, name)) for name in parts])
+    except FileNotFoundError:
+        # Compacted by another process while the deltas were read
+        return read_store_parts(key)
+
+    # A compaction in between could pair the old base file with a shortened delta list
+    return (df, parts) if store_version(key) == version else read_store_parts(key)
+
+
+def read_store(key):
+    return read_store_parts(key)[0]
+
+
+def delta_parts(key):
+    delta_dir = os.path.join(feature_store_path(key), DELTA_DIR)
+    if not os.path.isdir(delta_dir):
+        return []
+    return sorted(name for name in os.listdir(delta_dir) if name.endswith('.parquet'))
+
+
+def compacted_through(key):
+    # Last delta file folded into the base file, read from its Parquet footer; empty if never compacted
+    transformed_path = os.path.join(feature_store_path(key), TRANSFORMED_FILE)
+    if not os.path.exists(transformed_path):
+        return ''
+    return (pq.read_schema(transformed_path).metadata or {}).get(COMPACTED_THROUGH, b'').decode()
+
+
+def store_version(key):
+    # Store key, the compaction mark and the appended deltas, so a dataset's fingerprint changes after
+    # every append and every compaction
+    parts = delta_parts(key)
+    return f"{key}+{compacted_through(key)}+{len(parts)}:{parts[-1] if parts else ''}"
+
+
+def current_store_version():
+    return store_version(feature_store_key())
+
+
+def compact_store(key):
+    # Folds the delta files into the base file. Deltas appended meanwhile are newer than the mark and
+    # are kept, and only the folded files are removed, never another writer's temporary file
+    store_path = feature_store_path(key)
+    df, parts = read_store_parts(key)
+    if not parts:
+        return df
+
+    write_parquet_atomic(df, os.path.join(store_path, TRANSFORMED_FILE), {COMPACTED_THROUGH: parts[-1].encode()})
+    for name in parts:
+        try:
+            os.remove(os.path.join(store_path, DELTA_DIR, name))
+        except FileNotFoundError:
+            pass
+
+    return df
+
+
+@shared_stage(returns='new')
+def load_transformed_data(version):
+    # `version` (the store version) keys the cache, so every worker process picks up appends and
+    # compactions, not only the one that made them
+    key = feature_store_key()
+    transformed_path = os.path.join(feature_store_path(key), TRANSFORMED_FILE)
+
+    def build():
+        # Cold start with an unchanged input and pipeline: one columnar read
+        if os.path.exists(transformed_path):
+            return read_store(key)
+        return build_store(key)
+
+    # Published once as a memory-mapped Arrow file that every worker process attaches to
+    return shared_frames(shared_path(key), shared_name('transformed', version), build)[0]
+
+
+@profiled_cache(st.cache_data, max_entries=SHARED_STAGE_MAX_ENTRIES)
+def load_rollups(version):
+    key = feature_store_key()
+    cube_path = os.path.join(feature_store_path(key), ROLLUP_FILES['cube'])
+
+    # Stores written before rollups existed get them built once from the stored rows
+    if not os.path.exists(cube_path):
+        save_rollups(build_rollups(load_transformed_data(version)), key)
+
+    return read_rollups(key)
+
+
+@profiled_cache(st.cache_resource, max_entries=SHARED_STAGE_MAX_ENTRIES)
+def load_transformed_dataset(version):
+    # Shared handle: cached stages downstream are keyed on its fingerprint, not on the frame's rows
+    df = load_transformed_data(version)
+    return DatasetHandle(df, version, ('transformed',))
@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+# Declarative feature specs. Every feature is computed per station over its readings in time order,
+# with windows and half-lives counted in readings (hours for this data):
+#   'lag':     {column: [k, ...]}                             -> <column>_lag<k>
+#   'rolling': {column: {'windows': [w, ...], 'stats': [...]}} -> <column>_roll<w>_<stat>, stats from ROLLING_STATS
+#   'decay':   {column: [half_life, ...]}                     -> <column>_decay<half_life>
+# Rolling windows end at the current reading and need ROLLING_MIN_PERIODS valid values, as in create_aqi_column.
+# Decay features are exponentially weighted sums, e.g. rain that keeps washing out particles for a day or two
+LAG_FEATURE_SPEC = {'lag': {'PM2.5': [1], 'AQI': [1]}}
+FORECAST_FEATURE_SPEC = {
+    'lag': {'PM2.5': [1, 2, 3, 6, 12, 24, 48], 'AQI': [1, 2, 3, 6, 12, 24, 48], 'PM10': [1, 24], 'RAIN': [1, 24, 48]},
+    'rolling': {
+        'PM2.5': {'windows': [6, 24, 72], 'stats': ['mean', 'max', 'std']},
+        'AQI': {'windows': [6, 24, 72], 'stats': ['mean', 'max', 'std']},
+        'RAIN': {'windows': [24, 48], 'stats': ['sum', 'max']},
+        'WSPM': {'windows': [6, 24], 'stats': ['mean', 'max']},
+    },
+    'decay': {'RAIN': [12, 24, 48]},
+}
+ROLLING_STATS = ('mean', 'sum', 'max', 'min', 'std')
+ROLLING_MIN_PERIODS = 1
+# Decay sums stop once the remaining weight is below this, far under float32 resolution
+DECAY_TOLERANCE = 1e-12
+
+
+def station_time_order(df):
+    # One stable sort by (station in order of first appearance, timestamp index), plus each row's
+    # position within its station, in place of a boolean mask and a copy per station
+    station_codes, _ = pd.factorize(df['station'])
+    order = np.lexsort((df.index.to_numpy(), station_codes))
+
+    sorted_codes = station_codes[order]
+    counts = np.bincount(sorted_codes)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    positions = np.arange(len(order)) - np.repeat(starts, counts)
+
+    return order, sorted_codes, positions, counts
+
+
+def feature_names(spec):
+    names = [f"{col}_lag{k}" for col, lags in spec.get('lag', {}).items() for k in lags]
+    names += [f"{col}_roll{window}_{stat}" for col, rolling in spec.get('rolling', {}).items()
+              for window in rolling['windows'] for stat in rolling['stats']]
+    names += [f"{col}_decay{half_life}" for col, half_lives in spec.get('decay', {}).items() for half_life in half_lives]
+    return names
+
+
+def spec_columns(spec):
+    return list(dict.fromkeys(col for kind in ('lag', 'rolling', 'decay') for col in spec.get(kind, {})))
+
+
+def grouped_lag(values, positions, k):
+    lagged = np.full(len(values), np.nan)
+    lagged[k:] = values[:len(values) - k]
+    lagged[positions < k] = np.nan
+    return lagged
+
+
+def window_starts(positions, window):
+    # First row of each row's window, clipped to the start of its station
+    return np.arange(len(positions)) - np.minimum(positions, window - 1)
+
+
+def window_sums(cumulative, starts):
+    # cumulative has a leading zero, so the sum over rows starts..i is cumulative[i + 1] - cumulative[starts]
+    return cumulative[1:] - cumulative[starts]
+
+
+def grouped_window_extreme(values, positions, window, reduce):
+    # Doubling: after each step `extreme` holds the max (or min) over the last `span` rows of the
+    # station, so any window takes log2(window) vectorized steps. NaNs are skipped by fmax/fmin
+    index = np.arange(len(values))
+    extreme, span = values, 1
+    while span * 2 <= window:
+        extreme = reduce(extreme, extreme[index - np.minimum(positions, span)])
+        span *= 2
+    if span < window:
+        extreme = reduce(extreme, extreme[index - np.minimum(positions, window - span)])
+    return extreme
+
+
+def grouped_rolling(values, positions, window, stats, min_periods=ROLLING_MIN_PERIODS):
+    # Every stat of one window from the same prefix sums: O(rows) per stat, whatever the window
+    valid = ~np.isnan(values)
+    starts = window_starts(positions, window)
+    counts = window_sums(np.concatenate([[0], np.cumsum(valid)]), starts)
+    enough = counts >= max(min_periods, 1)
+
+    results = {}
+    if {'mean', 'sum', 'std'} & set(stats):
+        # Centered on the overall mean, so the sums of squares keep their precision
+        offset = np.nanmean(values) if valid.any() else 0.0
+        centered = np.where(valid, values - offset, 0.0)
+        sums = window_sums(np.concatenate([[0.0], np.cumsum(centered)]), starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+            if 'sum' in stats:
+                results['sum'] = sums + counts * offset
+            if 'mean' in stats:
+                results['mean'] = means + offset
+            if 'std' in stats:
+                squares = window_sums(np.concatenate([[0.0], np.cumsum(centered ** 2)]), starts)
+                variance = np.maximum(squares - sums * means, 0.0) / (counts - 1)
+                results['std'] = np.where(counts > 1, np.sqrt(variance), np.nan)
+    if 'max' in stats:
+        results['max'] = grouped_window_extreme(values, positions, window, np.fmax)
+    if 'min' in stats:
+        results['min'] = grouped_window_extreme(values, positions, window, np.fmin)
+
+    return {stat: np.where(enough, results[stat], np.nan) for stat in stats}
+
+
+def grouped_decay(values, positions, half_life):
+    # decay[i] = sum over the station's rows j <= i of values[j] * 0.5 ** ((i - j) / half_life), by a
+    # doubling scan: after each step `decay` covers the last 2 * span rows. Missing values add nothing
+    decay = np.nan_to_num(values)
+    factor = 0.5 ** (1 / half_life)
+    span = 1
+    while span <= positions.max(initial=0) and factor > DECAY_TOLERANCE:
+        shifted = np.zeros(len(decay))
+        shifted[span:] = decay[:len(decay) - span]
+        shifted[positions < span] = 0.0
+        decay = decay + factor * shifted
+        factor *= factor
+        span *= 2
+    return decay
+
+
+def build_features(df, spec):
+    # All features of `spec` in df's row order: one sort by station and time for the whole spec, then
+    # every feature is a handful of array operations over all stations at once
+    unknown = {stat for rolling in spec.get('rolling', {}).values() for stat in rolling['stats']} - set(ROLLING_STATS)
+    if unknown:
+        raise ValueError(f"rolling stats must be among {ROLLING_STATS}, got {sorted(unknown)}")
+
+    order, _, positions, _ = station_time_order(df)
+    features = {}
+
+    def emit(name, col, sorted_values):
+        # Back in df's row order, float32 when the source column is float32
+        values = np.empty(len(order), dtype=np.result_type(df[col].dtype, np.float32))
+        values[order] = sorted_values
+        features[name] = values
+
+    for col in spec_columns(spec):
+        values = df[col].to_numpy(dtype=float, na_value=np.nan)[order]
+
+        for k in spec.get('lag', {}).get(col, []):
+            emit(f"{col}_lag{k}", col, grouped_lag(values, positions, k))
+
+        rolling = spec.get('rolling', {}).get(col)
+        for window in rolling['windows'] if rolling else []:
+            for stat, result in grouped_rolling(values, positions, window, rolling['stats']).items():
+                emit(f"{col}_roll{window}_{stat}", col, result)
+
+        for half_life in spec.get('decay', {}).get(col, []):
+            emit(f"{col}_decay{half_life}", col, grouped_decay(values, positions, half_life))
+
+    return pd.DataFrame({name: features[name] for name in feature_names(spec)}, index=df.index)
+
+
+def add_features(df, spec):
+    df = df.copy(deep=False)
+    for name, values in build_features(df, spec).items():
+        df[name] = values.to_numpy()
+    return df
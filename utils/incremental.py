@@ -0,0 +1,119 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.feature_store import (
+    COMPACT_AFTER_DELTAS,
+    DELTA_DIR,
+    ROLLUP_FILES,
+    TAIL_FILE,
+    TRANSFORMED_FILE,
+    backfill_append_state,
+    build_store,
+    compact_store,
+    delta_parts,
+    feature_store_key,
+    feature_store_path,
+    per_station_windows,
+    read_rollups,
+    read_store,
+    save_rollups,
+    station_tail,
+    write_parquet_atomic
+)
+from utils.preprocessing import (
+    calculate_overall_aqi,
+    create_aqi_category_column,
+    create_timestamp_col
+)
+from utils.query import append_partitions
+from utils.rollups import build_rollups, merge_rollups
+from utils.streaming_cleaning import apply_cleaning
+
+ROLLING_WINDOW = 24
+
+
+def transform_new_readings(new_rows, tail, cleaning_params, per_station=False):
+  # Clean the batch with the imputation values and clip bounds fitted when the store was built
+  df = apply_cleaning(new_rows.copy(), cleaning_params)
+  df = create_timestamp_col.uncached(df)
+
+  df['vehicle_pollution'] = df[['PM2.5', 'PM10', 'NO2', 'CO']].sum(axis=1)
+  df['industrial_pollution'] = df[['SO2', 'O3']].sum(axis=1)
+
+  # The 24h windows are extended the way the store computed them, from its stored trailing rows
+  if per_station:
+      # Per-station stores restart the windows at each station, so only that station's rows count
+      df = df.sort_values(['station', 'timestamp'], kind='stable')
+      context = tail[tail['station'].isin(df['station'].unique())]
+      window = pd.concat([context[['station', 'PM2.5', 'PM10']], df[['station', 'PM2.5', 'PM10']]], ignore_index=True)
+      rolling = window.groupby('station', sort=False)[['PM2.5', 'PM10']].transform(
+          lambda s: s.rolling(window=ROLLING_WINDOW, min_periods=1).mean())
+  else:
+      # The single-frame pipeline rolls over the rows in file order, across stations, so the batch
+      # continues from the store's last rows whatever their station
+      context = tail.tail(ROLLING_WINDOW - 1)
+      window = pd.concat([context[['PM2.5', 'PM10']], df[['PM2.5', 'PM10']]], ignore_index=True)
+      rolling = window.rolling(window=ROLLING_WINDOW, min_periods=1).mean()
+  is_new = np.arange(len(window)) >= len(context)
+
+  concentrations = {
+      'PM2.5_24h': rolling['PM2.5'].to_numpy()[is_new],
+      'PM10_24h': rolling['PM10'].to_numpy()[is_new],
+      'SO2': df['SO2'].to_numpy(),
+      'NO2': df['NO2'].to_numpy(),
+      'CO': df['CO'].to_numpy(),
+      'O3': df['O3'].to_numpy(),
+  }
+  df['AQI'] = calculate_overall_aqi(concentrations).astype(df['PM2.5'].dtype)
+  df = create_aqi_category_column.uncached(df)
+
+  # Lag features, continuing from the last stored reading of each station
+  last_stored = tail[tail['station'].isin(df['station'].unique())].groupby('station', sort=False).tail(1)
+  lagged = pd.concat([last_stored[['station', 'PM2.5', 'AQI']], df[['station', 'PM2.5', 'AQI']]], ignore_index=True)
+  shifted = lagged.groupby('station', sort=False)[['PM2.5', 'AQI']].shift(1).iloc[len(last_stored):]
+  df['PM2.5_lag1'] = shifted['PM2.5'].to_numpy()
+  df['AQI_lag1'] = shifted['AQI'].to_numpy()
+
+  return df
+
+
+def append_readings(new_rows, key=None):
+    key = key or feature_store_key()
+    store_path = feature_store_path(key)
+
+    # First call for this data version: build the store under the requested key
+    if not os.path.exists(os.path.join(store_path, TRANSFORMED_FILE)):
+        build_store(key)
+
+    meta = backfill_append_state(key)
+    tail_path = os.path.join(store_path, TAIL_FILE)
+    tail = pd.read_parquet(tail_path)
+
+    transformed = transform_new_readings(new_rows, tail, meta['cleaning'], per_station_windows(key))
+
+    if os.path.exists(os.path.join(store_path, ROLLUP_FILES['cube'])):
+        rollups = read_rollups(key)
+    else:
+        rollups = build_rollups(read_store(key))
+
+    # Lags are rebuilt by adding_lag_feature at modeling time, so the delta keeps the stored schema
+    delta_dir = os.path.join(store_path, DELTA_DIR)
+    os.makedirs(delta_dir, exist_ok=True)
+    delta = transformed.drop(columns=['PM2.5_lag1', 'AQI_lag1'])
+    write_parquet_atomic(delta, os.path.join(delta_dir, f"part-{time.time_ns()}.parquet"))
+
+    tail = station_tail(pd.concat([tail, delta[tail.columns]]), ROLLING_WINDOW - 1)
+    write_parquet_atomic(tail, tail_path)
+
+    # Rollup cubes are (sum, count) based, so the batch's own cube is simply merged in
+    save_rollups(merge_rollups(rollups, build_rollups(delta)), key)
+    append_partitions(delta, key)
+
+    # The cached loaders are keyed on the store version, so every process reloads on its next rerun
+    if len(delta_parts(key)) >= COMPACT_AFTER_DELTAS:
+        compact_store(key)
+
+    return transformed
@@ -0,0 +1,264 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from utils.batch_scoring import MODEL_NAMES
+from utils.modeling_utils import apply_preprocessor, load_models, load_preprocessor
+from utils.preprocessing import AQI_CATEGORY_BINS, AQI_CATEGORY_LABELS
+
+BATCH_WINDOW_MS = 2.0
+MAX_BATCH_SIZE = 256
+LATENCY_SAMPLES = 10_000
+
+
+class ServingStats:
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.latencies = deque(maxlen=samples)
+        self.requests = 0
+        self.records = 0
+        self.batches = 0
+        self.batched_records = 0
+        self.errors = 0
+
+    def record_request(self, seconds, records):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+            self.records += records
+
+    def record_batch(self, records):
+        with self.lock:
+            self.batches += 1
+            self.batched_records += records
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def snapshot(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            uptime = time.perf_counter() - self.started
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if len(latencies) else (None, None)
+            return {
+                'uptime_sec': round(uptime, 1),
+                'requests': self.requests,
+                'records': self.records,
+                'errors': self.errors,
+                'batches': self.batches,
+                'mean_batch_size': round(self.batched_records / self.batches, 2) if self.batches else None,
+                'latency_ms': {
+                    'p50': None if p50 is None else round(float(p50), 3),
+                    'p99': None if p99 is None else round(float(p99), 3),
+                },
+                'requests_per_sec': round(self.requests / uptime, 1),
+                'records_per_sec': round(self.records / uptime, 1),
+            }
+
+
+class MicroBatcher:
+    # Requests arriving within `window_ms` of the first queued one are scored together, so
+    # concurrent single-record requests share one predict call per model. Each request is encoded
+    # and scaled on its own before it is queued, so a bad record fails only its own request
+    def __init__(self, models, preprocessor, stats, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE):
+        self.models = models
+        self.preprocessor = preprocessor
+        self.selected_features = models['selected_features']
+        self.stats = stats
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.pending = queue.Queue()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def prepare(self, records):
+        return apply_preprocessor(pd.DataFrame.from_records(records), self.preprocessor, self.selected_features)
+
+    def submit(self, model_name, records):
+        # Raises in the caller's thread for records that can't be encoded (unseen labels, non-numeric values)
+        X = self.prepare(records)
+        future = Future()
+        self.pending.put((model_name, X, future))
+        return future
+
+    def collect(self):
+        batch = [self.pending.get()]
+        size = len(batch[0][1])
+        deadline = time.perf_counter() + self.window
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[1])
+
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            by_model = {}
+            for item in batch:
+                by_model.setdefault(item[0], []).append(item)
+
+            for model_name, items in by_model.items():
+                try:
+                    self.score(model_name, items)
+                except Exception as exc:
+                    # The worker has to outlive any failure, or every pending and later request would hang
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(exc)
+
+    def predict(self, model_name, X):
+        model = self.models[model_name]
+        if model_name == 'XGBoost':
+            return model.inplace_predict(X)
+        return model.predict(X)
+
+    def score(self, model_name, items):
+        try:
+            X = items[0][1] if len(items) == 1 else pd.concat([X for _, X, _ in items], ignore_index=True)
+            predictions = np.asarray(self.predict(model_name, X), dtype=float)
+            categories = pd.cut(predictions, bins=AQI_CATEGORY_BINS, labels=AQI_CATEGORY_LABELS, right=False)
+            # NaN or infinite predictions are null, as json.dumps would write them as invalid JSON
+            results = [{'AQI': round(float(aqi), 2) if np.isfinite(aqi) else None,
+                        'AQI_category': None if pd.isna(category) else str(category)}
+                       for aqi, category in zip(predictions, categories)]
+            self.stats.record_batch(len(X))
+        except Exception as exc:
+            if len(items) > 1:
+                # Score each request alone, so only the ones that fail get the error
+                for item in items:
+                    self.score(model_name, [item])
+            else:
+                items[0][2].set_exception(exc)
+            return
+
+        offset = 0
+        for _, X, future in items:
+            future.set_result(results[offset:offset + len(X)])
+            offset += len(X)
+
+
+def load_serving_state(threads=1):
+    models = load_models()
+    models.prefetch()
+
+    # Single-request latency is dominated by thread pool start-up, not by the trees
+    models['XGBoost'].set_param({'nthread': threads})
+    for name in MODEL_NAMES:
+        if hasattr(models[name], 'n_jobs'):
+            models[name].n_jobs = threads
+
+    return models, load_preprocessor()
+
+
+def warm_up(batcher):
+    # One scored record per model, so the first real request doesn't pay for lazy initialisation
+    record = {feature: 0.0 for feature in batcher.selected_features}
+    for col, le in batcher.preprocessor['encoders'].items():
+        if col in record:
+            record[col] = le.classes_[0]
+    for name in MODEL_NAMES:
+        batcher.submit(name, [record]).result()
+
+
+def make_handler(batcher, stats):
+    class InferenceHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {'status': 'ok', 'models': MODEL_NAMES})
+            elif self.path == '/metrics':
+                self.send_json(200, stats.snapshot())
+            else:
+                self.send_json(404, {'error': f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self.send_json(404, {'error': f"unknown path {self.path}"})
+                return
+
+            start = time.perf_counter()
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                if length < 0:
+                    raise ValueError("invalid Content-Length")
+                payload = json.loads(self.rfile.read(length))
+                if not isinstance(payload, dict):
+                    raise ValueError("request body must be a JSON object")
+                model_name = payload.get('model', 'XGBoost')
+                records = payload['records'] if 'records' in payload else [payload['record']]
+                if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+                    raise ValueError("records must be a non-empty list of JSON objects")
+                if model_name not in MODEL_NAMES:
+                    raise ValueError(f"model must be one of {MODEL_NAMES}")
+                missing = set(batcher.selected_features).difference(*records)
+                if missing:
+                    raise ValueError(f"missing features: {sorted(missing)}")
+
+                predictions = batcher.submit(model_name, records).result()
+            except (KeyError, ValueError, TypeError) as exc:
+                stats.record_error()
+                self.send_json(400, {'error': str(exc)})
+                return
+            except Exception as exc:
+                # Anything else is a server-side failure, but the client still gets a response
+                stats.record_error()
+                self.send_json(500, {'error': f"{type(exc).__name__}: {exc}"})
+                return
+
+            stats.record_request(time.perf_counter() - start, len(records))
+            self.send_json(200, {'model': model_name, 'predictions': predictions})
+
+        def log_message(self, format, *args):
+            pass
+
+    return InferenceHandler
+
+
+def serve(host, port, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE, threads=1):
+    models, preprocessor = load_serving_state(threads)
+    stats = ServingStats()
+    batcher = MicroBatcher(models, preprocessor, stats, window_ms, max_batch_size)
+    warm_up(batcher)
+
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, stats))
+    print(f"Serving AQI predictions on http://{host}:{port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve online AQI predictions from the saved models.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--window-ms', type=float, default=BATCH_WINDOW_MS,
+                        help='how long to wait for more requests before scoring a micro-batch')
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--threads', type=int, default=1, help='prediction threads per model')
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.window_ms, args.max_batch_size, args.threads)
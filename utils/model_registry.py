@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import gdown
+import joblib
+import xgboost as xgb
+
+from utils.feature_store import file_digest
+from utils.profiling import profile_stage
+
+# Point this at a local artifact directory to skip the Google Drive download entirely
+MODEL_DIR = os.environ.get("AQI_MODEL_DIR", "models")
+RANDOM_FOREST_URL = "https://drive.google.com/uc?id=1cNBMmLE3cwv06C764fIeiz3fyIL08BVE"
+# sklearn pickles the compact exports are built from
+SOURCE_FILES = {
+    'RandomForest': "random_forest_model.pkl",
+    'AdaBoost': "ada_boost_model.pkl",
+}
+
+
+def load_pickle(path):
+    # Uncompressed joblib pickles hand their numpy buffers back as read-only memory maps,
+    # which the OS page cache shares between server processes
+    return joblib.load(path, mmap_mode='r')
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_digest(path)}
+
+
+def matches_source(source, path):
+    # A missing pickle can't be stale against its export (the forest may simply not be downloaded).
+    # Otherwise size and mtime must match, or the content when a copy or checkout changed the mtime
+    if not os.path.exists(path):
+        return True
+    if not source:
+        return False
+    stat = os.stat(path)
+    if stat.st_size != source['size']:
+        return False
+    return stat.st_mtime_ns == source['mtime_ns'] or file_digest(path) == source['sha256']
+
+
+def load_compact(model_dir, name, source_name):
+    # Flat-array export written by utils.compact_trees, preferred over the sklearn pickle when present
+    # and exported from the pickle as it is now; a retrained pickle makes the export stale
+    path = os.path.join(model_dir, name)
+    if not os.path.exists(path):
+        return None
+    model = load_pickle(path)
+    return model if matches_source(getattr(model, 'source', None), os.path.join(model_dir, source_name)) else None
+
+
+def load_random_forest(model_dir, compact=False):
+    if compact:
+        model = load_compact(model_dir, "random_forest_compact.pkl", SOURCE_FILES['RandomForest'])
+        if model is not None:
+            return model
+
+    # can't push to github due to size limitations, so it's fetched from Google Drive when not present locally
+    path = os.path.join(model_dir, SOURCE_FILES['RandomForest'])
+    if not os.path.exists(path):
+        gdown.download(RANDOM_FOREST_URL, path, quiet=False)
+    return load_pickle(path)
+
+
+def load_ada_boost(model_dir, compact=False):
+    if compact:
+        model = load_compact(model_dir, "ada_boost_compact.pkl", SOURCE_FILES['AdaBoost'])
+        if model is not None:
+            return model
+
+    return load_pickle(os.path.join(model_dir, SOURCE_FILES['AdaBoost']))
+
+
+def load_xgboost(model_dir):
+    path = os.path.join(model_dir, "xgb_model.json")
+    if os.path.exists(path):
+        booster = xgb.Booster()
+        booster.load_model(path)
+        return booster
+
+    # Only the pickled XGBRegressor is shipped in the repo
+    return joblib.load(os.path.join(model_dir, "xgb_model.pkl")).get_booster()
+
+
+def load_selected_features(model_dir):
+    return joblib.load(os.path.join(model_dir, "selected_features.pkl"))
+
+
+MODEL_LOADERS = {
+    'RandomForest': lambda model_dir: load_random_forest(model_dir, compact=True),
+    'AdaBoost': lambda model_dir: load_ada_boost(model_dir, compact=True),
+    'XGBoost': load_xgboost,
+    'selected_features': load_selected_features,
+}
+
+
+class ModelRegistry:
+    # Dict-like view of the saved models: each one is loaded on first access, and `prefetch`
+    # starts loading others in background threads so they are ready by the time they are needed
+    def __init__(self, model_dir=MODEL_DIR, max_workers=len(MODEL_LOADERS)):
+        self.model_dir = model_dir
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.load_seconds = {}
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='model-loader')
+
+    def timed_load(self, name):
+        start = time.perf_counter()
+        with profile_stage(f"load_model[{name}]"):
+            model = MODEL_LOADERS[name](self.model_dir)
+        self.load_seconds[name] = time.perf_counter() - start
+        return model
+
+    def future(self, name):
+        with self.lock:
+            if name not in self.futures:
+                self.futures[name] = self.executor.submit(self.timed_load, name)
+            return self.futures[name]
+
+    def prefetch(self, names=None):
+        for name in names or MODEL_LOADERS:
+            self.future(name)
+
+    def is_loaded(self, name):
+        future = self.futures.get(name)
+        return future is not None and future.done() and future.exception() is None
+
+    def __getitem__(self, name):
+        if name not in MODEL_LOADERS:
+            raise KeyError(name)
+
+        future = self.future(name)
+        try:
+            return future.result()
+        except Exception:
+            # Let the next access retry, e.g. after a failed download
+            with self.lock:
+                if self.futures.get(name) is future:
+                    del self.futures[name]
+            raise
+
+    def get(self, name, default=None):
+        return self[name] if name in MODEL_LOADERS else default
+
+    def __contains__(self, name):
+        return name in MODEL_LOADERS
+
+    def keys(self):
+        return MODEL_LOADERS.keys()
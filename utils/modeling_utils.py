@@ -1,75 +1,57 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from sklearn.preprocessing import LabelEncoder
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import joblib
+import hashlib
 import os
-import gdown
 import xgboost as xgb
+from utils.plot_utils import MAX_SCATTER_POINTS, plot_actual_vs_predicted
+from utils.dataset import cache_stage, shared_stage
+from utils.features import LAG_FEATURE_SPEC, add_features, station_time_order
+from utils.feature_store import current_store_version, feature_store_key, file_digest, load_transformed_dataset, shared_path
+from utils.model_registry import MODEL_DIR, SOURCE_FILES, ModelRegistry
+from utils.profiling import profiled_cache
+from utils.query import QUERY_CACHE_ENTRIES, QUERY_CACHE_TTL, filter_mask
+from utils.render_cache import show_chart
+from utils.shared_data import shared_frames, shared_name
+
+PREPROCESSOR_FILE = "preprocessor.pkl"
+FEATURE_IMPORTANCE_FILE = "feature_importances.pkl"
+VERSIONED_MODEL_FILES = ["ada_boost_model.pkl", "xgb_model.json", "xgb_model.pkl", "selected_features.pkl"]
+IMPORTANCE_SAMPLE_ROWS = 50_000
 
 @st.cache_resource
 def load_models():
-    model_dir = "models"
-    models = {}
-
-    # can't push to github due to size limitations
-    # models['RandomForest'] = joblib.load(os.path.join(model_dir, "random_forest_model.pkl"))
-    models['AdaBoost'] = joblib.load(os.path.join(model_dir, "ada_boost_model.pkl"))
-    models['selected_features'] = joblib.load(os.path.join(model_dir, "selected_features.pkl"))
-
-    xgb_model = xgb.Booster()
-    xgb_model.load_model(os.path.join(model_dir, "xgb_model.json"))
-    models['XGBoost'] = xgb_model
-
-    # Random Forest Model from Google Drive
-    rf_model_path = os.path.join(model_dir, "random_forest_model.pkl")
-    if not os.path.exists(rf_model_path):
-        url = "https://drive.google.com/uc?id=1cNBMmLE3cwv06C764fIeiz3fyIL08BVE"
-        gdown.download(url, rf_model_path, quiet=False)
-
-    models['RandomForest'] = joblib.load(rf_model_path)
-
-    return models
-
-@st.cache_data
-def adding_lag_feature(df):
-  df = df.sort_values(['station', 'year', 'month'])
-  df['PM2.5_lag1'] = df.groupby('station')['PM2.5'].shift(1)
-  df['AQI_lag1'] = df.groupby('station')['AQI'].shift(1)
+    # Nothing is read until a model is first used; see ModelRegistry.prefetch to warm them in the background
+    return ModelRegistry(MODEL_DIR)
+
+# The modeling stages take DatasetHandles, so their cache keys hash the fingerprint and never the frame
+@shared_stage(returns='new')
+def adding_lag_feature(dataset):
+  df = dataset.data.sort_values(['station', 'year', 'month'])
+  df = add_features(df, LAG_FEATURE_SPEC)
   df.dropna(inplace=True)
 
   return df
 
-@st.cache_data
-def splitting_data_set(df):
-  # Split data by station, then chronologically within each station
-  train_data_list = []
-  test_data_list = []
+def lagged_dataset(dataset):
+  return dataset.derive('lagged', adding_lag_feature(dataset))
 
-  # Loop through each station in the dataset
-  for station in df['station'].unique():
-      station_data = df[df['station'] == station]
-
-      # Ensure the data is sorted by time (timestamp)
-      station_data = station_data.sort_index()
-
-      # Determine split index
-      split_index = int(len(station_data) * 0.8)
-
-      # Split data for this station using iloc
-      train_data_list.append(station_data.iloc[:split_index])
-      test_data_list.append(station_data.iloc[split_index:])
+@shared_stage(returns='new')
+def splitting_data_set(dataset, train_fraction=0.8):
+  # Split data by station, then chronologically within each station
+  df = dataset.data
+  order, sorted_codes, positions, counts = station_time_order(df)
+  split_index = (counts * train_fraction).astype(int)
+  is_train = positions < split_index[sorted_codes]
 
-  # Combine all the station-specific train and test data
-  train_data = pd.concat(train_data_list)
-  test_data = pd.concat(test_data_list)
+  train_data = df.iloc[order[is_train]]
+  test_data = df.iloc[order[~is_train]]
 
-  # Now, you have train_data and test_data with the correct split
   X_train = train_data.drop('AQI', axis=1)
   y_train = train_data['AQI']
   X_test = test_data.drop('AQI', axis=1)
@@ -77,60 +59,199 @@ def splitting_data_set(df):
 
   return X_train, y_train, X_test, y_test
 
-@st.cache_data
-def feature_encoding(X_train, X_test):
-  categorical_cols = ['wd', 'station', 'AQI_category']
-
-  for col in categorical_cols:
+@cache_stage(max_entries=QUERY_CACHE_ENTRIES, ttl=QUERY_CACHE_TTL)
+def filtered_test_mask(dataset, stations=None, start=None, end=None, categories=None):
+  # Test rows matching the sidebar filters, keyed on the fingerprint and the filters, so a filtered
+  # rerun neither goes through the split stages nor rescans the test rows
+  _, _, test_rows, _ = splitting_data_set(lagged_dataset(dataset))
+  return filter_mask(test_rows, stations, start, end, categories)
+
+def time_series_folds(df, n_splits=5, min_train_fraction=0.5):
+  # Rolling-origin folds within every station: fold k trains on each station's readings before its
+  # k-th cut-off and tests on the readings up to the next one. Yields positional index arrays into
+  # df (usable with df.iloc or as a scikit-learn `cv` iterable) rather than copies of the data
+  order, sorted_codes, positions, counts = station_time_order(df)
+  fractions = np.linspace(min_train_fraction, 1, n_splits + 1)
+  cuts = (counts[:, None] * fractions).astype(int)
+
+  for k in range(n_splits):
+      start = cuts[sorted_codes, k]
+      end = cuts[sorted_codes, k + 1]
+      yield order[positions < start], order[(positions >= start) & (positions < end)]
+
+def fit_preprocessor(X_train):
+  # LabelEncoder for the categorical columns, then StandardScaler over every numeric column
+  # (the encoded ones included), fitted on the training split the models were trained on
+  X_train = X_train.copy()
+  encoders = {}
+
+  for col in ['wd', 'station', 'AQI_category']:
       le = LabelEncoder()
       X_train[col] = le.fit_transform(X_train[col])
-      X_test[col] = le.transform(X_test[col])
-
-  return X_train, X_test
+      encoders[col] = le
+
+  # Every numeric column, whether the frame holds float64/int64 or the compact float32 and small ints
+  scaled_cols = X_train.select_dtypes(include=['number']).columns.tolist()
+  scaler = StandardScaler().fit(X_train[scaled_cols])
+
+  return {'columns': X_train.columns.tolist(), 'encoders': encoders, 'scaler': scaler, 'scaled_cols': scaled_cols}
+
+def encode_labels(values, le):
+  if isinstance(values.dtype, pd.CategoricalDtype) and not values.isna().any():
+      # Encode each category once and gather by code, instead of materializing every label as a string
+      values = values.cat.remove_unused_categories()
+      dtype = np.int8 if len(le.classes_) <= np.iinfo(np.int8).max else np.int16
+      return le.transform(np.asarray(values.cat.categories)).astype(dtype)[values.cat.codes.to_numpy()]
+  return le.transform(values)
+
+def apply_preprocessor(X, preprocessor, columns=None):
+  # Each column is encoded and scaled independently, so callers may pass only the columns they need
+  columns = list(columns) if columns is not None else preprocessor['columns']
+  X = X[columns].copy()
+
+  for col, le in preprocessor['encoders'].items():
+      if col in X:
+          X[col] = encode_labels(X[col], le)
+
+  scaler = preprocessor['scaler']
+  scaled_cols = [col for col in columns if col in preprocessor['scaled_cols']]
+  positions = [preprocessor['scaled_cols'].index(col) for col in scaled_cols]
+
+  # float32 when every input fits in it (compact frames), float64 otherwise
+  dtype = np.result_type(np.float32, *[X[col].dtype for col in scaled_cols])
+  mean = scaler.mean_[positions].astype(dtype)
+  scale = scaler.scale_[positions].astype(dtype)
+  X[scaled_cols] = (X[scaled_cols].to_numpy(dtype=dtype) - mean) / scale
+
+  return X
+
+def model_version(model_dir=MODEL_DIR):
+  # The preprocessor is only valid for the models it was fitted alongside
+  digest = hashlib.sha256()
+  for name in VERSIONED_MODEL_FILES:
+      path = os.path.join(model_dir, name)
+      if os.path.exists(path):
+          digest.update(name.encode())
+          digest.update(file_digest(path).encode())
+  return digest.hexdigest()
+
+def save_preprocessor(preprocessor, model_dir=MODEL_DIR):
+  artifact = {'model_version': model_version(model_dir), **preprocessor}
+  path = os.path.join(model_dir, PREPROCESSOR_FILE)
+  tmp_path = f"{path}.tmp"
+  joblib.dump(artifact, tmp_path)
+  os.replace(tmp_path, path)
+
+def fit_training_preprocessor():
+  X_train, _, _, _ = splitting_data_set(lagged_dataset(load_transformed_dataset(current_store_version())))
+  return fit_preprocessor(X_train)
+
+def read_preprocessor(model_dir=MODEL_DIR):
+  # The saved preprocessor, if it was saved for the model files currently in model_dir
+  path = os.path.join(model_dir, PREPROCESSOR_FILE)
+  if os.path.exists(path):
+      artifact = joblib.load(path)
+      if artifact.pop('model_version') == model_version(model_dir):
+          return artifact
+  return None
+
+@profiled_cache(st.cache_resource)
+def load_preprocessor(model_dir=MODEL_DIR):
+  preprocessor = read_preprocessor(model_dir)
+  if preprocessor is not None:
+      return preprocessor
+
+  # Missing or saved for other models: fit once from the training split and persist it,
+  # so later cold starts only transform
+  preprocessor = fit_training_preprocessor()
+  save_preprocessor(preprocessor, model_dir)
+  return preprocessor
+
+@shared_stage(returns='new')
+def execute_data_preprocessing(dataset):
+  def build():
+    X_train, y_train, X_test, y_test = splitting_data_set(lagged_dataset(dataset))
+
+    preprocessor = load_preprocessor()
+    X_train = apply_preprocessor(X_train, preprocessor)
+    X_test = apply_preprocessor(X_test, preprocessor)
+
+    return X_train, y_train, X_test, y_test
+
+  # Published once per dataset and preprocessor as memory-mapped Arrow files shared by every worker process
+  name = shared_name('preprocessed', dataset.fingerprint, model_version())
+  return shared_frames(shared_path(feature_store_key()), name, build, count=4)
+
+def load_training_features():
+  X_train, y_train, _, _ = splitting_data_set(lagged_dataset(load_transformed_dataset(current_store_version())))
+  return apply_preprocessor(X_train, load_preprocessor()), y_train
+
+def compute_feature_importances(X_train, y_train, method='forest', sample_rows=IMPORTANCE_SAMPLE_ROWS, booster=None,
+                                n_jobs=-1):
+  if method == 'xgb_gain':
+      # Free once the booster is loaded, but only ranks the features the model was trained on
+      scores = booster.get_score(importance_type='gain')
+      importances = np.array([scores.get(col, 0.0) for col in X_train.columns])
+      # A booster without any split (e.g. a constant target) has no gain; all-zero, as sklearn reports it
+      total = importances.sum()
+      importances = importances / total if total > 0 else importances
+  else:
+      # Forest importances stabilise well before the full training set, and the trees are fitted in parallel
+      if sample_rows and len(X_train) > sample_rows:
+          rows = np.sort(np.random.default_rng(42).choice(len(X_train), sample_rows, replace=False))
+          X_train, y_train = X_train.iloc[rows], y_train.iloc[rows]
+      model = RandomForestRegressor(n_jobs=n_jobs, random_state=42)
+      model.fit(X_train, y_train)
+      importances = model.feature_importances_
 
-@st.cache_data
-def feature_scaling(X_train, X_test):
-  scaler = StandardScaler()
-  scaled_cols = X_train.select_dtypes(include=['float64', 'int64']).columns.tolist()
-
-  X_train[scaled_cols] = scaler.fit_transform(X_train[scaled_cols])
-  X_test[scaled_cols] = scaler.transform(X_test[scaled_cols])
-
-  return X_train, X_test
-
-@st.cache_data
-def execute_data_preprocessing(df):
-  df = adding_lag_feature(df)
-
-  X_train, y_train, X_test, y_test = splitting_data_set(df)
-
-  X_train, X_test = feature_encoding(X_train, X_test)
-
-  X_train, X_test = feature_scaling(X_train, X_test)
-
-  return X_train, y_train, X_test, y_test
-
-@st.cache_data
-def execute_feature_selection(X_train, y_train):
-  # Fit a RandomForestRegressor model
-  model = RandomForestRegressor()
-  model.fit(X_train, y_train)
-
-  # Get feature importance
-  feature_importances = model.feature_importances_
-
-  # Create a DataFrame with features and their importance scores
   importance_df = pd.DataFrame({
       'Feature': X_train.columns,
-      'Importance': feature_importances
+      'Importance': importances
   })
 
-  # Sort features by importance
-  importance_df = importance_df.sort_values(by='Importance', ascending=False)
-
+  return importance_df.sort_values(by='Importance', ascending=False)
+
+def save_feature_importances(importance_df, method, model_dir=MODEL_DIR):
+  artifact = {'model_version': model_version(model_dir), 'method': method, 'importances': importance_df}
+  path = os.path.join(model_dir, FEATURE_IMPORTANCE_FILE)
+  tmp_path = f"{path}.tmp"
+  joblib.dump(artifact, tmp_path)
+  os.replace(tmp_path, path)
+
+@profiled_cache(st.cache_resource)
+def load_feature_importances(model_dir=MODEL_DIR):
+  path = os.path.join(model_dir, FEATURE_IMPORTANCE_FILE)
+  if os.path.exists(path):
+      artifact = joblib.load(path)
+      if artifact['model_version'] == model_version(model_dir):
+          return artifact['importances']
+
+  # Not computed offline for these models yet: use the fast forest once and persist the result
+  X_train, y_train = load_training_features()
+  importance_df = compute_feature_importances(X_train, y_train)
+  save_feature_importances(importance_df, 'forest', model_dir)
   return importance_df
 
-def show_model_results(models, model_name, X_test, y_test):
+def file_stamp(path):
+  # Size and mtime, enough to notice a rewritten artifact without hashing it
+  if not os.path.exists(path):
+      return ""
+  stat = os.stat(path)
+  return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def importances_version(model_dir=MODEL_DIR):
+  # Keys the importance chart: the importances are recomputed offline for the same models with other methods
+  return f"{model_version(model_dir)}|{file_stamp(os.path.join(model_dir, FEATURE_IMPORTANCE_FILE))}"
+
+def results_version(model_name, test_version, model_dir=MODEL_DIR):
+  # Keys a results chart: the test rows, the model files and, as the forest pickle isn't part of
+  # model_version, its stamp
+  parts = [test_version, model_name, model_version(model_dir)]
+  if model_name == 'RandomForest':
+      parts.append(file_stamp(os.path.join(model_dir, SOURCE_FILES['RandomForest'])))
+  return "|".join(parts)
+
+def show_model_results(models, model_name, X_test, y_test, test_version, kind='scatter', max_points=MAX_SCATTER_POINTS):
     model = models.get(model_name)
 
     if model:
@@ -157,15 +278,9 @@ def show_model_results(models, model_name, X_test, y_test):
 
         # Actual vs Predicted Plot
         st.markdown("#### 📈 Actual vs Predicted AQI")
-        fig, ax = plt.subplots(figsize=(10, 6))
-        sns.scatterplot(x=y_test, y=y_pred, color='green', alpha=0.6, ax=ax)
-        ax.plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], color='red', linestyle='--')
-        ax.set_xlabel("Actual AQI")
-        ax.set_ylabel("Predicted AQI")
-        ax.set_title(f"Actual vs Predicted AQI ({model_name})")
-        ax.grid(True)
-        plt.tight_layout()
-        st.pyplot(fig)
+        results = pd.DataFrame({'actual': np.asarray(y_test), 'predicted': np.asarray(y_pred)})
+        show_chart(plot_actual_vs_predicted, results, model_name, kind, max_points,
+                   version=results_version(model_name, test_version))
 
 
     else:
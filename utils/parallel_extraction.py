@@ -0,0 +1,67 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+
+from utils.preprocessing import (
+    create_timestamp_col,
+    create_aqi_column,
+    create_aqi_category_column
+)
+
+# Partitions are exchanged as Arrow IPC files; on Linux /dev/shm keeps them in shared memory
+SHARED_MEMORY_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def _write_arrow(df, path):
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _read_arrow(path):
+    # Memory-mapped read, so nothing is unpickled or read into an intermediate buffer. to_pandas() still
+    # copies the columns into pandas blocks, so each partition is materialized once per process
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def extract_station_features(df):
+  # Same steps as execute_feature_extraction_operations, for a single station and without st.cache_data
+  df = create_timestamp_col.uncached(df)
+  df['vehicle_pollution'] = df[['PM2.5', 'PM10', 'NO2', 'CO']].sum(axis=1)
+  df['industrial_pollution'] = df[['SO2', 'O3']].sum(axis=1)
+  df = create_aqi_column.uncached(df)
+  df = create_aqi_category_column.uncached(df)
+
+  return df
+
+
+def _extract_partition(in_path, out_path):
+    _write_arrow(extract_station_features(_read_arrow(in_path)), out_path)
+    return out_path
+
+
+def execute_feature_extraction_operations_parallel(df, max_workers=None):
+  # Stations are independent, so each one gets its own worker. Unlike the single-frame path, the
+  # 24h rolling PM means never cross from one station into the next.
+  max_workers = max_workers or os.cpu_count()
+  if df.empty:
+    # No stations to hand out, and a pool needs at least one worker
+    return extract_station_features(df)
+
+  with tempfile.TemporaryDirectory(prefix="aqi-features-", dir=SHARED_MEMORY_DIR) as tmp_dir:
+    in_paths = []
+    for i, (_, station_df) in enumerate(df.groupby('station', sort=False)):
+      path = os.path.join(tmp_dir, f"in-{i}.arrow")
+      _write_arrow(station_df.reset_index(drop=True), path)
+      in_paths.append(path)
+    out_paths = [os.path.join(tmp_dir, f"out-{i}.arrow") for i in range(len(in_paths))]
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(in_paths))) as executor:
+      results = list(executor.map(_extract_partition, in_paths, out_paths))
+
+    # Reassemble in the original station order
+    return pd.concat([_read_arrow(path) for path in results])
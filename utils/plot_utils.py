@@ -1,11 +1,53 @@
-import streamlit as st
+import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+from utils.rollups import rollup, correlation_matrix
 
-@st.cache_data
-def plot_average_aqi_per_year(df):
+# Point budget for scatter plots; larger inputs are downsampled (or drawn as hexbin density)
+MAX_SCATTER_POINTS = 20_000
+
+
+def sample_points(df, max_points=MAX_SCATTER_POINTS, stratify_by=None, seed=42):
+    if len(df) <= max_points:
+        return df
+
+    # Proportional sample per stratum, so small groups stay visible in the same share as in the data
+    frac = max_points / len(df)
+    if stratify_by is None:
+        return df.sample(frac=frac, random_state=seed)
+    return df.groupby(stratify_by, observed=True, group_keys=False).sample(frac=frac, random_state=seed)
+
+
+def fit_trend_line(x, y):
+    # Closed-form least squares over every row, instead of regplot's bootstrapped fit
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+    if len(x) == 0:
+        return 0.0, np.nan
+
+    x_mean, y_mean = x.mean(), y.mean()
+    x_variance = ((x - x_mean) ** 2).sum()
+    # Constant x (e.g. a filtered slice without any rain) has no slope; draw a flat line at the mean
+    if x_variance == 0:
+        return 0.0, y_mean
+    slope = ((x - x_mean) * (y - y_mean)).sum() / x_variance
+    return slope, y_mean - slope * x_mean
+
+
+def draw_points(ax, df, x, y, kind='scatter', max_points=MAX_SCATTER_POINTS, stratify_by=None, color=None, alpha=None):
+    if kind == 'hexbin':
+        hb = ax.hexbin(df[x], df[y], gridsize=60, bins='log', mincnt=1, cmap='viridis')
+        ax.figure.colorbar(hb, ax=ax, label='Count (log)')
+    else:
+        sampled = sample_points(df, max_points, stratify_by)
+        sns.scatterplot(data=sampled, x=x, y=y, color=color, alpha=alpha, ax=ax)
+
+
+def plot_average_aqi_per_year(rollups):
   # Group by year and calculate mean AQI
-  yearly_avg = df.groupby('year')['AQI'].mean().reset_index()
+  yearly_avg = rollup(rollups['cube'], ['year'], ['AQI'])
 
   fig, ax = plt.subplots(figsize=(10, 5))
 
@@ -17,9 +59,8 @@ def plot_average_aqi_per_year(df):
   return fig
 
 
-@st.cache_data
-def plot_stationwise_aqi(df):
-    yearly_avg_by_station = df.groupby(['year', 'station'])['AQI'].mean().reset_index()
+def plot_stationwise_aqi(rollups):
+    yearly_avg_by_station = rollup(rollups['cube'], ['year', 'station'], ['AQI'])
 
     fig, ax = plt.subplots(figsize=(10, 5))
     sns.pointplot(data=yearly_avg_by_station, x='year', y='AQI', hue='station', palette='husl', linestyles='-', ax=ax)
@@ -31,9 +72,8 @@ def plot_stationwise_aqi(df):
 
     return fig
 
-@st.cache_data
-def plot_monthlywise_aqi_per_year(df):
-  monthly_yearly_avg = df.groupby(['year', 'month'])['AQI'].mean().reset_index()
+def plot_monthlywise_aqi_per_year(rollups):
+  monthly_yearly_avg = rollup(rollups['cube'], ['year', 'month'], ['AQI'])
 
   fig, ax = plt.subplots(figsize=(10, 5))
   sns.pointplot(data=monthly_yearly_avg, x='month', y='AQI', hue='year', palette='viridis', linestyles='-')
@@ -46,9 +86,8 @@ def plot_monthlywise_aqi_per_year(df):
   return fig
 
 # 2
-@st.cache_data
-def plot_yearly_pollution_trend(df):
-    yearly_avg = df.groupby(['year'])[['vehicle_pollution', 'industrial_pollution']].mean().reset_index()
+def plot_yearly_pollution_trend(rollups):
+    yearly_avg = rollup(rollups['cube'], ['year'], ['vehicle_pollution', 'industrial_pollution'])
 
     fig, ax = plt.subplots(figsize=(10, 5))
     sns.lineplot(data=yearly_avg, x='year', y='vehicle_pollution', label='Vehicle Pollution', color='blue', marker='o')
@@ -61,9 +100,8 @@ def plot_yearly_pollution_trend(df):
 
     return fig
 
-@st.cache_data
-def plot_monthly_pollution_pattern(df):
-    monthly_seasonal = df.groupby('month')[['vehicle_pollution', 'industrial_pollution']].mean().reset_index()
+def plot_monthly_pollution_pattern(rollups):
+    monthly_seasonal = rollup(rollups['cube'], ['month'], ['vehicle_pollution', 'industrial_pollution'])
 
     fig, ax = plt.subplots(figsize=(10, 5))
     sns.lineplot(data=monthly_seasonal, x='month', y='vehicle_pollution', label='Vehicle Pollution', color='blue', marker='o')
@@ -78,9 +116,8 @@ def plot_monthly_pollution_pattern(df):
 
     return fig
 
-@st.cache_data
-def plot_yearly_pollution_contribution(df):
-    yearly_pollution = df.groupby('year')[['vehicle_pollution', 'industrial_pollution']].sum().reset_index()
+def plot_yearly_pollution_contribution(rollups):
+    yearly_pollution = rollup(rollups['cube'], ['year'], ['vehicle_pollution', 'industrial_pollution'], stat='sum')
 
     fig, ax = plt.subplots(figsize=(10, 5))
     ax.bar(yearly_pollution['year'], yearly_pollution['vehicle_pollution'], label='Vehicle Pollution', color='skyblue')
@@ -95,9 +132,8 @@ def plot_yearly_pollution_contribution(df):
 
     return fig
 
-@st.cache_data
-def plot_pollution_by_station_and_year(df):
-    pollution_by_station_year = df.groupby(['station', 'year'])[['vehicle_pollution', 'industrial_pollution']].sum().reset_index()
+def plot_pollution_by_station_and_year(rollups):
+    pollution_by_station_year = rollup(rollups['cube'], ['station', 'year'], ['vehicle_pollution', 'industrial_pollution'], stat='sum')
 
     df_melted = pollution_by_station_year.melt(
         id_vars=['station', 'year'],
@@ -125,11 +161,14 @@ def plot_pollution_by_station_and_year(df):
     return g.fig
 
 # 3
-@st.cache_data
-def plot_rainfall_vs_aqi(df):
+def plot_rainfall_vs_aqi(dataset, kind='scatter', max_points=MAX_SCATTER_POINTS):
+    df = dataset.data
     fig, ax = plt.subplots(figsize=(8, 5))
-    sns.scatterplot(data=df, x='RAIN', y='AQI', alpha=0.6, ax=ax)
-    sns.regplot(data=df, x='RAIN', y='AQI', scatter=False, color='red', label='Trend Line', ax=ax)
+    draw_points(ax, df, 'RAIN', 'AQI', kind, max_points, stratify_by='station', alpha=0.6)
+
+    slope, intercept = fit_trend_line(df['RAIN'], df['AQI'])
+    x_range = np.array([df['RAIN'].min(), df['RAIN'].max()])
+    ax.plot(x_range, slope * x_range + intercept, color='red', label='Trend Line')
     ax.set_title('Rainfall vs AQI')
     ax.set_xlabel('Rainfall (mm)')
     ax.set_ylabel('AQI')
@@ -138,18 +177,18 @@ def plot_rainfall_vs_aqi(df):
 
     return fig
 
-@st.cache_data
-def plot_rain_vs_pollution(df):
+def plot_rain_vs_pollution(dataset, kind='scatter', max_points=MAX_SCATTER_POINTS):
+    df = dataset.data
     fig, axes = plt.subplots(1, 2, figsize=(12, 5))
 
     # Rain vs Vehicle Pollution
-    sns.scatterplot(data=df, x='RAIN', y='vehicle_pollution', color='blue', ax=axes[0])
+    draw_points(axes[0], df, 'RAIN', 'vehicle_pollution', kind, max_points, stratify_by='station', color='blue')
     axes[0].set_title('Rain vs Vehicle Pollution')
     axes[0].set_xlabel('Rainfall (mm)')
     axes[0].set_ylabel('Vehicle Pollution')
 
     # Rain vs Industrial Pollution
-    sns.scatterplot(data=df, x='RAIN', y='industrial_pollution', color='orange', ax=axes[1])
+    draw_points(axes[1], df, 'RAIN', 'industrial_pollution', kind, max_points, stratify_by='station', color='orange')
     axes[1].set_title('Rain vs Industrial Pollution')
     axes[1].set_xlabel('Rainfall (mm)')
     axes[1].set_ylabel('Industrial Pollution')
@@ -157,9 +196,8 @@ def plot_rain_vs_pollution(df):
     plt.tight_layout()
     return fig
 
-@st.cache_data
-def plot_seasonal_temp_dewp(df):
-    monthly_seasonal = df.groupby('month')[['TEMP', 'DEWP']].mean().reset_index()
+def plot_seasonal_temp_dewp(rollups):
+    monthly_seasonal = rollup(rollups['cube'], ['month'], ['TEMP', 'DEWP'])
 
     fig, ax = plt.subplots(figsize=(12, 6))
     sns.lineplot(data=monthly_seasonal, x='month', y='TEMP', marker='o', label='Temperature (°C)', color='red', ax=ax)
@@ -177,10 +215,9 @@ def plot_seasonal_temp_dewp(df):
     return fig
 
 # 4
-@st.cache_data
-def plot_correlation_heatmap(df):
+def plot_correlation_heatmap(rollups):
     num_cols = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3', 'TEMP', 'PRES', 'DEWP', 'RAIN', 'WSPM', 'AQI', 'vehicle_pollution', 'industrial_pollution']
-    corr_matrix = df[num_cols].corr()
+    corr_matrix = correlation_matrix(rollups['moments'], num_cols)
 
     fig, ax = plt.subplots(figsize=(14, 10))
     sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', fmt=".2f", ax=ax)
@@ -189,7 +226,6 @@ def plot_correlation_heatmap(df):
 
     return fig
 
-@st.cache_data
 def plot_top_feature_importance(top_features_df):
     fig, ax = plt.subplots(figsize=(12, 6))
     sns.barplot(x='Importance', y='Feature', data=top_features_df, hue='Feature', palette='viridis', ax=ax)
@@ -198,4 +234,17 @@ def plot_top_feature_importance(top_features_df):
     ax.set_ylabel('Feature')
     plt.tight_layout()
 
-    return fig
\ No newline at end of file
+    return fig
+
+def plot_actual_vs_predicted(results, model_name, kind='scatter', max_points=MAX_SCATTER_POINTS):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    draw_points(ax, results, 'actual', 'predicted', kind, max_points, color='green', alpha=0.6)
+    low, high = results['actual'].min(), results['actual'].max()
+    ax.plot([low, high], [low, high], color='red', linestyle='--')
+    ax.set_xlabel("Actual AQI")
+    ax.set_ylabel("Predicted AQI")
+    ax.set_title(f"Actual vs Predicted AQI ({model_name})")
+    ax.grid(True)
+    plt.tight_layout()
+
+    return fig
@@ -3,24 +3,123 @@ import pandas as pd
 import numpy as np
 from sklearn.impute import SimpleImputer
 import os
+from utils.dataset import shared_stage
+
+DATA_PATH = os.path.join("data", "air_quality_data_combined.csv")
+
+# declared schema of the combined csv file
+POLLUTANT_COLS = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3']
+WEATHER_COLS = ['TEMP', 'PRES', 'DEWP', 'RAIN', 'WSPM']
+RAW_SCHEMA = {
+    'No': 'int32',
+    'year': 'int16',
+    'month': 'int8',
+    'day': 'int8',
+    'hour': 'int8',
+    **{col: 'float32' for col in POLLUTANT_COLS + WEATHER_COLS},
+    'wd': 'category',
+    'station': 'category',
+}
+CHUNK_SIZE = 100_000
+# Memory-optimized mode: read with RAW_SCHEMA and keep float32, small integers and categoricals
+# through every stage instead of widening to float64, int64 and strings
+COMPACT_DTYPES = os.environ.get("AQI_COMPACT_DTYPES", "0") == "1"
 
 # load the csv file
-@st.cache_data
-def load_data():
-    data_path = os.path.join("data", "air_quality_data_combined.csv")
-    df = pd.read_csv(data_path)
+@shared_stage(returns='new')
+def load_data(compact=COMPACT_DTYPES):
+    df = pd.read_csv(DATA_PATH, dtype=RAW_SCHEMA if compact else None)
     return df
 
-@st.cache_data
+
+def _time_key(year, month, day, hour):
+    # Sortable integer key (YYYYMMDDHH), cheaper than building datetimes for every chunk
+    return ((year.astype('int64') * 100 + month) * 100 + day) * 100 + hour
+
+
+def _timestamp_key(value):
+    ts = pd.Timestamp(value)
+    return ((ts.year * 100 + ts.month) * 100 + ts.day) * 100 + ts.hour
+
+
+def iter_data_chunks(path=DATA_PATH, columns=None, stations=None, start=None, end=None, chunksize=CHUNK_SIZE):
+  columns = list(columns) if columns is not None else list(RAW_SCHEMA)
+  filter_cols = []
+  if stations is not None:
+    filter_cols.append('station')
+  if start is not None or end is not None:
+    filter_cols += ['year', 'month', 'day', 'hour']
+
+  # Read only the projected columns plus the ones the row filters need
+  usecols = columns + [col for col in filter_cols if col not in columns]
+  dtype = {col: RAW_SCHEMA[col] for col in usecols if col in RAW_SCHEMA}
+
+  for chunk in pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize):
+    mask = np.ones(len(chunk), dtype=bool)
+
+    if stations is not None:
+      mask &= chunk['station'].isin(stations).to_numpy()
+
+    if start is not None or end is not None:
+      key = _time_key(chunk['year'], chunk['month'], chunk['day'], chunk['hour']).to_numpy()
+      if start is not None:
+        mask &= key >= _timestamp_key(start)
+      if end is not None:
+        # `end` is an inclusive date, as in the query layer: every hour of that day is kept
+        mask &= key < _timestamp_key(pd.Timestamp(end).normalize() + pd.Timedelta(days=1))
+
+    if not mask.all():
+      chunk = chunk[mask]
+
+    yield chunk[columns]
+
+
+@shared_stage(returns='new')
+def load_data_streaming(path=DATA_PATH, columns=None, stations=None, start=None, end=None, chunksize=CHUNK_SIZE):
+  # Chunks are split into column arrays as they arrive and each column is concatenated and released in
+  # turn, so the peak is the result plus one column rather than every chunk plus the whole result
+  parts = {}
+  categories = {}
+
+  for chunk in iter_data_chunks(path, columns, stations, start, end, chunksize):
+    for col in chunk.columns:
+      values = chunk[col]
+      if isinstance(values.dtype, pd.CategoricalDtype):
+        # Every chunk infers its own categories, so keep codes against a shared set that only grows;
+        # earlier chunks' codes stay valid against the final one
+        known = categories.get(col, pd.Index([], dtype=object))
+        categories[col] = known.append(values.cat.categories.difference(known))
+        values = values.cat.set_categories(categories[col]).cat.codes
+      parts.setdefault(col, []).append(values.to_numpy())
+
+  if not parts:
+    return pd.DataFrame({col: pd.Series(dtype=RAW_SCHEMA.get(col)) for col in (columns or RAW_SCHEMA)})
+
+  data = {}
+  for col in list(parts):
+    values = np.concatenate(parts.pop(col))
+    data[col] = pd.Categorical.from_codes(values, categories[col]) if col in categories else values
+  # copy=False keeps one block per column instead of consolidating them into a second copy
+  return pd.DataFrame(data, copy=False)
+
+@shared_stage(returns='new')
 def handling_missing_values(df):
+  df = df.copy(deep=False)
   # Impute numerical columns with the mean
   numerical_cols = df.select_dtypes(include=['float64', 'int64']).columns
 
-  # Create an imputer for numerical data
-  numerical_imputer = SimpleImputer(strategy='mean')
+  # One column at a time, so only a single float64 column is allocated at once rather than the whole
+  # numeric block (which SimpleImputer also returns as float64, like here)
+  for col in numerical_cols:
+      values = df[col].astype('float64')
+      df[col] = values.fillna(values.mean())
 
-  # Apply the imputer to the numerical columns
-  df[numerical_cols] = numerical_imputer.fit_transform(df[numerical_cols])
+  # Compact columns keep their dtype: the mean is accumulated in float64 and filled in as float32
+  for col in df.select_dtypes(include=['float32']).columns:
+      df[col] = df[col].fillna(np.float32(np.nanmean(df[col].to_numpy(), dtype=np.float64)))
+  for col in df.select_dtypes(include=['category']).columns:
+      if df[col].isna().any():
+          df[col] = df[col].fillna(df[col].mode().iloc[0])
 
   # Impute categorical columns with the mode (most frequent value)
   categorical_cols = df.select_dtypes(include=['object']).columns
@@ -28,13 +127,15 @@ def handling_missing_values(df):
   # Create an imputer for categorical data
   categorical_imputer = SimpleImputer(strategy='most_frequent')
 
-  # Apply the imputer to the categorical columns
-  df[categorical_cols] = categorical_imputer.fit_transform(df[categorical_cols])
+  # Apply the imputer to the categorical columns (none are left as strings in compact mode)
+  if len(categorical_cols):
+      df[categorical_cols] = categorical_imputer.fit_transform(df[categorical_cols])
 
   return df
 
-@st.cache_data
+@shared_stage(returns='new')
 def outlier_handling(df):
+  df = df.copy(deep=False)
   # Select only numerical columns
   numeric_cols = df.select_dtypes(include=['number']).columns.to_list()
   numeric_cols.remove('No') # excluding `No` column
@@ -45,14 +146,16 @@ def outlier_handling(df):
 
   # Winsorization (1st and 99th percentiles)
   for col in numeric_cols:
-      lower = df[col].quantile(0.01)
-      upper = df[col].quantile(0.99)
+      # Bounds in the column's own dtype, so float32 columns aren't widened by the clip
+      lower = df[col].dtype.type(df[col].quantile(0.01))
+      upper = df[col].dtype.type(df[col].quantile(0.99))
       df[col] = df[col].clip(lower=lower, upper=upper)
 
   return df
 
-@st.cache_data
+@shared_stage(returns='view')
 def create_timestamp_col(df):
+  df = df.copy(deep=False)
     # Create `timestamp` column
   df['timestamp'] = pd.to_datetime(df[['year', 'month', 'day', 'hour']])
 
@@ -65,70 +168,109 @@ def create_timestamp_col(df):
   return df
 
 
+# breakpoint for calculating AQI for each one: (C_low, C_high, I_low, I_high)
+BREAKPOINTS_PM25_PER_DAY = [(0, 35, 0, 50), (35, 75, 51, 100), (75, 115, 101, 150), (115, 150, 151, 200),
+                            (150, 250, 201, 300), (250, 350, 301, 400), (350, 500, 401, 500)]
+
+BREAKPOINTS_PM10_PER_DAY = [(0, 50, 0, 50), (51, 150, 51, 100), (151, 250, 101, 150), (251, 350, 151, 200),
+                            (350, 420, 201, 300), (420, 500, 301, 400), (500, 600, 401, 500)]
+
+BREAKPOINTS_SO2_PER_HOUR = [(0, 150, 0, 50), (151, 500, 51, 100), (501, 650, 101, 150), (651, 800, 151, 200),
+                            (801, 1600, 201, 300), (1601, 2100, 301, 400), (2100, 2620, 401, 500)]
+
+BREAKPOINTS_NO2_PER_HOUR = [(0, 100, 0, 50), (101, 200, 51, 100), (201, 700, 101, 150), (701, 1200, 151, 200),
+                            (1201, 2340, 201, 300), (2341, 3090, 301, 400), (3091, 3840, 401, 500)]
+
+BREAKPOINTS_CO_PER_HOUR = [(0, 5000, 0, 50), (5001, 10000, 51, 100), (10001, 35000, 101, 150), (35001, 60000, 151, 200),
+                           (60001, 90000, 201, 300), (90001, 120000, 301, 400), (120001, 150000, 401, 500)]
+
+BREAKPOINTS_O3_PER_HOUR = [(0, 160, 0, 50), (161, 200, 51, 100), (201, 300, 101, 150), (301, 400, 151, 200),
+                           (401, 800, 201, 300), (801, 1000, 301, 400), (1001, 1200, 401, 500)]
+
+# breakpoint tables as arrays, keyed by the concentration column each sub-index is computed from
+AQI_BREAKPOINTS = {
+    'PM2.5_24h': np.array(BREAKPOINTS_PM25_PER_DAY, dtype=float),
+    'PM10_24h': np.array(BREAKPOINTS_PM10_PER_DAY, dtype=float),
+    'SO2': np.array(BREAKPOINTS_SO2_PER_HOUR, dtype=float),
+    'NO2': np.array(BREAKPOINTS_NO2_PER_HOUR, dtype=float),
+    'CO': np.array(BREAKPOINTS_CO_PER_HOUR, dtype=float),
+    'O3': np.array(BREAKPOINTS_O3_PER_HOUR, dtype=float),
+}
+
+
+# per-value reference implementation, kept for benchmarking the vectorized engine against it
 def calculate_aqi(conc, breakpoints):
     for C_low, C_high, I_low, I_high in breakpoints:
         if C_low <= conc <= C_high:
             return ((I_high - I_low) / (C_high - C_low)) * (conc - C_low) + I_low
     return np.nan
 
-@st.cache_data
-def create_aqi_column(df):
-  # breakpoint for calculating AQI for each one
-  breakpoints_pm25_per_day = [(0, 35, 0, 50), (35, 75, 51, 100), (75, 115, 101, 150), (115, 150, 151, 200),
-                      (150, 250, 201, 300), (250, 350, 301, 400), (350, 500, 401, 500)]
-
-  breakpoints_pm10_per_day = [(0, 50, 0, 50), (51, 150, 51, 100), (151, 250, 101, 150), (251, 350, 151, 200),
-                      (350, 420, 201, 300), (420, 500, 301, 400), (500, 600, 401, 500)]
 
-  breakpoints_so2_per_hour = [(0, 150, 0, 50), (151, 500, 51, 100), (501, 650, 101, 150), (651, 800, 151, 200),
-                     (801, 1600, 201, 300), (1601, 2100, 301, 400), (2100, 2620, 401, 500)]
+def calculate_aqi_vectorized(conc, breakpoints):
+    conc = np.asarray(conc, dtype=float)
+    c_low, c_high, i_low, i_high = np.asarray(breakpoints, dtype=float).T
+    slope = (i_high - i_low) / (c_high - c_low)
 
-  breakpoints_no2_per_hour = [(0, 100, 0, 50), (101, 200, 51, 100), (201, 700, 101, 150), (701, 1200, 151, 200),
-                     (1201, 2340, 201, 300), (2341, 3090, 301, 400), (3091, 3840, 401, 500)]
+    # Upper bounds are sorted, so the first band with C_high >= conc is the band the loop above would pick
+    band = np.searchsorted(c_high, conc, side='left')
+    np.minimum(band, len(c_high) - 1, out=band)
+    band_low = c_low.take(band)
 
-  breakpoints_co_per_hour = [(0, 5000, 0, 50), (5001, 10000, 51, 100), (10001, 35000, 101, 150), (35001, 60000, 151, 200),
-                    (60001, 90000, 201, 300), (90001, 120000, 301, 400), (120001, 150000, 401, 500)]
+    # Values in the gaps between bands, above the last band or NaN don't match any band
+    matched = (band_low <= conc) & (conc <= c_high.take(band))
 
-  breakpoints_o3_per_hour = [(0, 160, 0, 50), (161, 200, 51, 100), (201, 300, 101, 150), (301, 400, 151, 200),
-                    (401, 800, 201, 300), (801, 1000, 301, 400), (1001, 1200, 401, 500)]
+    aqi = slope.take(band) * (conc - band_low) + i_low.take(band)
+    aqi[~matched] = np.nan
+    return aqi
 
-  # 24-hour averages for PM2.5 and PM10
-  df['PM2.5_24h'] = df['PM2.5'].rolling(window=24, min_periods=1).mean()
-  df['PM10_24h'] = df['PM10'].rolling(window=24, min_periods=1).mean()
 
-  # AQI per pollutant
-  df['AQI_PM25'] = df['PM2.5_24h'].apply(lambda x: calculate_aqi(x, breakpoints_pm25_per_day))
-  df['AQI_PM10'] = df['PM10_24h'].apply(lambda x: calculate_aqi(x, breakpoints_pm10_per_day))
-  df['AQI_SO2'] = df['SO2'].apply(lambda x: calculate_aqi(x, breakpoints_so2_per_hour))
-  df['AQI_NO2'] = df['NO2'].apply(lambda x: calculate_aqi(x, breakpoints_no2_per_hour))
-  df['AQI_CO'] = df['CO'].apply(lambda x: calculate_aqi(x, breakpoints_co_per_hour))
-  df['AQI_O3'] = df['O3'].apply(lambda x: calculate_aqi(x, breakpoints_o3_per_hour))
+def calculate_overall_aqi(concentrations):
+    # Final AQI: max value among all pollutant sub-indices, ignoring pollutants without a matching band
+    aqi = None
+    for col, breakpoints in AQI_BREAKPOINTS.items():
+        sub_index = calculate_aqi_vectorized(concentrations[col], breakpoints)
+        aqi = sub_index if aqi is None else np.fmax(aqi, sub_index)
 
-  # Final AQI: max value among all pollutants
-  df['AQI'] = df[['AQI_PM25', 'AQI_PM10', 'AQI_SO2', 'AQI_NO2', 'AQI_CO', 'AQI_O3']].max(axis=1).round()
+    return np.round(aqi)
 
-  # Keeping only `AQI` column, droping other column related to calculating AQI
-  df.drop(['PM2.5_24h', 'PM10_24h', 'AQI_PM25', 'AQI_PM10', 'AQI_SO2', 'AQI_NO2', 'AQI_CO', 'AQI_O3'], axis=1, inplace=True)
+@shared_stage(returns='view')
+def create_aqi_column(df):
+  df = df.copy(deep=False)
+  # 24-hour averages for PM2.5 and PM10
+  concentrations = {
+      'PM2.5_24h': df['PM2.5'].rolling(window=24, min_periods=1).mean().to_numpy(),
+      'PM10_24h': df['PM10'].rolling(window=24, min_periods=1).mean().to_numpy(),
+      'SO2': df['SO2'].to_numpy(),
+      'NO2': df['NO2'].to_numpy(),
+      'CO': df['CO'].to_numpy(),
+      'O3': df['O3'].to_numpy(),
+  }
+
+  # AQI per pollutant and the final AQI in one batched pass; whole numbers up to 500, so float32 holds
+  # them exactly when the pollutants are float32
+  df['AQI'] = calculate_overall_aqi(concentrations).astype(df['PM2.5'].dtype)
 
   return df
 
 
-@st.cache_data
-def create_aqi_category_column(df):
-  bins = [0, 50, 100, 150, 200, 300, float('inf')]
-  labels = ['Good', 'Moderate', 'Unhealthy for sensitive group', 'Unhealthy', 'Very Unhealthy', 'Hazardous']
+AQI_CATEGORY_BINS = [0, 50, 100, 150, 200, 300, float('inf')]
+AQI_CATEGORY_LABELS = ['Good', 'Moderate', 'Unhealthy for sensitive group', 'Unhealthy', 'Very Unhealthy', 'Hazardous']
 
-  df['AQI_category'] = pd.cut(df['AQI'], bins=bins, labels=labels, right=False)
+@shared_stage(returns='view')
+def create_aqi_category_column(df):
+  df = df.copy(deep=False)
+  df['AQI_category'] = pd.cut(df['AQI'], bins=AQI_CATEGORY_BINS, labels=AQI_CATEGORY_LABELS, right=False)
 
   return df
 
-@st.cache_data
+@shared_stage(returns='view')
 def execute_feature_extraction_operations(df):
-  df = create_timestamp_col(df)
+  # The inner steps run uncached: only this stage's result is kept, not a cache entry per intermediate frame
+  df = create_timestamp_col.uncached(df)
   #adding two new columns
   df['vehicle_pollution'] = df[['PM2.5', 'PM10', 'NO2', 'CO']].sum(axis=1)
   df['industrial_pollution'] = df[['SO2', 'O3']].sum(axis=1)
-  df = create_aqi_column(df)
-  df = create_aqi_category_column(df)
+  df = create_aqi_column.uncached(df)
+  df = create_aqi_category_column.uncached(df)
 
   return df
\ No newline at end of file
@@ -0,0 +1,278 @@
+import collections
+import contextlib
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+# Stage calls are appended here as one JSON object per line; an empty value disables the file
+STAGE_LOG = os.environ.get("AQI_STAGE_LOG", os.path.join("data", "stage_log.jsonl"))
+# The log is moved to STAGE_LOG + ".1" (replacing the previous one) once it grows past this size
+STAGE_LOG_MAX_BYTES = int(float(os.environ.get("AQI_STAGE_LOG_MAX_MB", "16")) * 2**20)
+# Cache hits happen on every rerun, so only one in this many is written to the log (with a
+# `weight` so counts stay right); all of them are kept in `recent_records`
+HIT_LOG_SAMPLE = int(os.environ.get("AQI_STAGE_LOG_HIT_SAMPLE", "100"))
+RECENT_RECORDS = 2_000
+MIB = 2**20
+
+recent_records = collections.deque(maxlen=RECENT_RECORDS)
+log_lock = threading.Lock()
+hit_counts = collections.Counter()
+local = threading.local()
+
+
+def count_rows(value):
+    # Rows of a frame, of a DatasetHandle's frame, or of the first frame in a tuple of stage results
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(getattr(value, 'data', None), pd.DataFrame):
+        return len(value.data)
+    if isinstance(value, (tuple, list)):
+        for item in value:
+            rows = count_rows(item)
+            if rows is not None:
+                return rows
+    return None
+
+
+def memory_status():
+    # Current and peak resident set size from /proc, so there is no psutil dependency and no
+    # allocation tracing overhead; (None, None) where /proc isn't available
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(':', 1) for line in f)
+        return int(fields['VmRSS'].split()[0]) * 1024, int(fields['VmHWM'].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def rss_bytes():
+    return memory_status()[0]
+
+
+def reset_peak_rss():
+    # Linux resets the peak RSS to the current RSS when "5" is written to clear_refs
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def open_stages():
+    if not hasattr(local, 'stack'):
+        local.stack = []
+    return local.stack
+
+
+def update_peaks(stack):
+    # The kernel keeps one peak for the whole process, so it is folded into every open stage before
+    # a nested stage resets it
+    peak = memory_status()[1]
+    for frame in stack:
+        if frame['peak'] is not None and peak is not None:
+            frame['peak'] = max(frame['peak'], peak)
+
+
+def rotated_path(path):
+    return f"{path}.1"
+
+
+def append_log(record):
+    if not STAGE_LOG:
+        return
+
+    with log_lock:
+        os.makedirs(os.path.dirname(STAGE_LOG) or ".", exist_ok=True)
+        with open(STAGE_LOG, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+            size = f.tell()
+        if size > STAGE_LOG_MAX_BYTES:
+            os.replace(STAGE_LOG, rotated_path(STAGE_LOG))
+
+
+def write_record(record):
+    recent_records.append(record)
+    append_log(record)
+
+
+def record_hit(name, rows_in, rows_out, wall_seconds, cpu_seconds):
+    # Hits only look a result up, so they skip the /proc reads and the peak reset of profile_stage
+    stack = open_stages()
+    record = {
+        'stage': name,
+        'parent': stack[-1]['record']['stage'] if stack else None,
+        'started_at': datetime.datetime.now().isoformat(timespec='milliseconds'),
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'cache': 'hit',
+        'wall_seconds': round(wall_seconds, 6),
+        'cpu_seconds': round(cpu_seconds, 6),
+        'thread': threading.current_thread().name,
+        'pid': os.getpid(),
+    }
+    recent_records.append(record)
+    with log_lock:
+        hit_counts[name] += 1
+        sampled = HIT_LOG_SAMPLE <= 1 or hit_counts[name] % HIT_LOG_SAMPLE == 1
+    if sampled:
+        append_log({**record, 'weight': max(HIT_LOG_SAMPLE, 1)})
+
+
+@contextlib.contextmanager
+def profile_stage(name, rows_in=None):
+    # Records wall time, process CPU time, the peak RSS above the RSS at entry, the RSS change, and
+    # rows in/out. The caller may set record['rows_out'] and record['cache'] before the block ends.
+    # CPU time and memory are per process, so with concurrent sessions they include other threads' work
+    stack = open_stages()
+    record = {
+        'stage': name,
+        'parent': stack[-1]['record']['stage'] if stack else None,
+        'started_at': datetime.datetime.now().isoformat(timespec='milliseconds'),
+        'rows_in': rows_in,
+        'rows_out': None,
+        'cache': None,
+    }
+
+    update_peaks(stack)
+    rss_start = rss_bytes()
+    frame = {'record': record, 'base': rss_start, 'peak': rss_start if reset_peak_rss() else None}
+    stack.append(frame)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as exc:
+        record['error'] = type(exc).__name__
+        raise
+    finally:
+        record['wall_seconds'] = round(time.perf_counter() - wall_start, 6)
+        record['cpu_seconds'] = round(time.process_time() - cpu_start, 6)
+        update_peaks(stack)
+        rss_end = rss_bytes()
+        if frame['peak'] is not None:
+            record['peak_memory_mib'] = round((frame['peak'] - frame['base']) / MIB, 3)
+        if rss_start is not None and rss_end is not None:
+            record['rss_delta_mib'] = round((rss_end - rss_start) / MIB, 3)
+            record['rss_mib'] = round(rss_end / MIB, 3)
+        record['thread'] = threading.current_thread().name
+        record['pid'] = os.getpid()
+        stack.pop()
+        write_record(record)
+
+
+def profiled_cache(cache, **kwargs):
+    # A Streamlit cache decorator (st.cache_data or st.cache_resource) whose calls are all recorded as
+    # stages. A miss runs the wrapped function, which is profiled in full; a hit gets a lightweight record
+    def decorate(func):
+        @functools.wraps(func)
+        def compute(*args, **func_kwargs):
+            local.miss = True
+            with profile_stage(func.__name__, count_rows(args)) as record:
+                record['cache'] = 'miss'
+                result = func(*args, **func_kwargs)
+                record['rows_out'] = count_rows(result)
+            return result
+
+        cached = cache(compute, **kwargs)
+
+        @functools.wraps(func)
+        def stage(*args, **stage_kwargs):
+            outer_miss = getattr(local, 'miss', None)
+            local.miss = False
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            try:
+                result = cached(*args, **stage_kwargs)
+                if not local.miss:
+                    record_hit(func.__name__, count_rows(args), count_rows(result),
+                               time.perf_counter() - wall_start, time.process_time() - cpu_start)
+            finally:
+                # Restored so a stage called inside another one doesn't overwrite its caller's status
+                local.miss = outer_miss
+            return result
+
+        stage.clear = cached.clear
+        return stage
+
+    return decorate
+
+
+def profiled(name=None):
+    # The same recording for functions that aren't cached
+    def decorate(func):
+        @functools.wraps(func)
+        def stage(*args, **kwargs):
+            with profile_stage(name or func.__name__, count_rows(args)) as record:
+                result = func(*args, **kwargs)
+                record['rows_out'] = count_rows(result)
+            return result
+
+        return stage
+
+    return decorate
+
+
+def tail_lines(path, max_lines, block_size=1 << 16):
+    # The last `max_lines` lines of a file, read backwards in blocks so a long log isn't read in full
+    if max_lines <= 0 or not os.path.exists(path):
+        return []
+
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        data = b''
+        while position > 0 and data.count(b'\n') <= max_lines:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+
+    lines = data.splitlines()
+    # The first line is partial unless the read reached the start of the file
+    if position > 0:
+        lines = lines[1:]
+    return [line.decode() for line in lines[-max_lines:]]
+
+
+def read_stage_log(path=STAGE_LOG, max_records=50_000):
+    # The most recent records of the JSONL log, including those written by earlier server processes
+    if not path or not (os.path.exists(path) or os.path.exists(rotated_path(path))):
+        return pd.DataFrame(list(recent_records))
+
+    lines = tail_lines(path, max_records)
+    lines = tail_lines(rotated_path(path), max_records - len(lines)) + lines
+    return pd.DataFrame([json.loads(line) for line in lines if line.strip()])
+
+
+def summarize_stages(records):
+    if records.empty:
+        return records
+
+    # Sampled hits stand for `weight` calls each
+    weight = records['weight'].fillna(1) if 'weight' in records else 1
+    records = records.assign(calls=weight, hit=records['cache'].eq('hit') * weight,
+                             miss=records['cache'].eq('miss'))
+    summary = records.groupby('stage').agg(
+        calls=('calls', 'sum'),
+        cache_hits=('hit', 'sum'),
+        cache_misses=('miss', 'sum'),
+        wall_seconds_mean=('wall_seconds', 'mean'),
+        wall_seconds_max=('wall_seconds', 'max'),
+        cpu_seconds_mean=('cpu_seconds', 'mean'),
+        rows_in_max=('rows_in', 'max'),
+        rows_out_max=('rows_out', 'max'),
+    )
+    for column in ['peak_memory_mib', 'rss_mib']:
+        if column in records:
+            summary[f"{column}_max"] = records.groupby('stage')[column].max()
+
+    # Misses are the calls that did the work, so their timings are the ones to size pods with
+    misses = records[records['miss']].groupby('stage')['wall_seconds'].mean()
+    summary['miss_wall_seconds_mean'] = misses
+    return summary.sort_values('wall_seconds_max', ascending=False)
@@ -0,0 +1,93 @@
+import numpy as np
+
+DEFAULT_K = 4096
+# Compaction offsets are random; a fixed seed keeps the cleaning bounds the same between runs on the same data
+DEFAULT_SEED = 42
+
+
+# KLL quantile sketch (Karnin, Lang & Liberty, 2016). Items on level h stand for 2**h values, so
+# sketches built over different chunks or partitions can be merged level by level.
+class KLLSketch:
+    def __init__(self, k=DEFAULT_K, seed=DEFAULT_SEED):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.compacted = False
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        while True:
+            overfull = [h for h, items in enumerate(self.levels) if len(items) > self._capacity(h)]
+            if not overfull:
+                return
+
+            h = overfull[0]
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+
+            # Keep every other item of the sorted level (random offset) at double weight
+            items = np.sort(self.levels[h])
+            held_back = items[-1:] if len(items) % 2 else items[:0]
+            items = items[:len(items) - len(held_back)]
+            promoted = items[self._rng.integers(2)::2]
+
+            self.levels[h] = held_back
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            self.compacted = True
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+
+        self.n += other.n
+        self.compacted = self.compacted or other.compacted
+        self._compress()
+        return self
+
+    def quantile(self, q, repeated=None):
+        # `repeated` is a (value, count) point mass counted exactly in the ranks without entering the
+        # sketch, e.g. imputed values: inserted copies would add levels and shrink the lower ones
+        value, count = repeated if repeated else (np.nan, 0)
+        n = self.n + count
+        if n == 0:
+            return np.nan
+
+        values = np.concatenate(self.levels + [np.full(1 if count else 0, value)])
+        weights = np.concatenate([np.full(len(items), 1 << h) for h, items in enumerate(self.levels)]
+                                 + [np.full(1 if count else 0, count)])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        last_rank = np.cumsum(weights[order]) - 1
+
+        # Linear interpolation between the neighbouring ranks, same as DataFrame.quantile when exact
+        rank = q * (n - 1)
+        lower = values[np.searchsorted(last_rank, np.floor(rank), side='left')]
+        upper = values[np.searchsorted(last_rank, np.ceil(rank), side='left')]
+        return lower + (rank - np.floor(rank)) * (upper - lower)
+
+    def rank_error(self, repeated_count=0):
+        # Normalized rank error at ~99% confidence (empirical bound published with Apache DataSketches KLL).
+        # An exact point mass adds no error, so the sketch's absolute error is spread over more ranks
+        if not self.compacted:
+            return 0.0
+        return 2.296 / self.k ** 0.9723 * self.n / (self.n + repeated_count)
+
+    def quantile_bounds(self, q, repeated=None):
+        eps = self.rank_error(repeated[1] if repeated else 0)
+        return self.quantile(max(q - eps, 0.0), repeated), self.quantile(min(q + eps, 1.0), repeated)
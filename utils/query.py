@@ -0,0 +1,215 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from utils.dataset import DatasetHandle, cache_stage
+from utils.feature_store import (
+    TRANSFORMED_FILE,
+    build_store,
+    feature_store_key,
+    feature_store_path,
+    read_store,
+    store_version,
+    write_json_atomic,
+    write_parquet_atomic
+)
+from utils.preprocessing import AQI_CATEGORY_BINS, AQI_CATEGORY_LABELS
+from utils.profiling import profiled_cache
+from utils.rollups import build_rollups
+
+PARTITION_DIR = "partitions"
+PARTITION_INDEX_FILE = "partition_index.parquet"
+PARTITION_META_FILE = "partition_meta.json"
+# Filtered slices kept per process: each entry pins its own frame, and the sidebar can produce any
+# number of filter combinations, so old slices are evicted by count and dropped after an idle hour
+QUERY_CACHE_ENTRIES = 16
+QUERY_CACHE_TTL = 3600
+
+
+def write_partitions(df, key, suffix=""):
+    # One file per station with a row group per year-month, plus min/max statistics per row group so
+    # queries can skip row groups without opening their files. Month-sized files would be a few
+    # hundred rows each, too small for the per-file overhead of reading them
+    store_path = feature_store_path(key)
+    stats = []
+
+    for station, part in df.groupby(df['station'].astype(str).to_numpy(), sort=True):
+        relative_path = os.path.join(PARTITION_DIR, f"station={station}", f"readings{suffix}.parquet")
+        path = os.path.join(store_path, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        months = np.asarray(part.index.year * 100 + part.index.month)
+        schema = pa.Schema.from_pandas(part)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for row_group, (month_key, month) in enumerate(part.groupby(months, sort=True)):
+                writer.write_table(pa.Table.from_pandas(month, schema=schema), row_group_size=len(month))
+                stats.append({
+                    'station': station,
+                    'year_month': f"{month_key // 100:04d}-{month_key % 100:02d}",
+                    'path': relative_path,
+                    'row_group': row_group,
+                    'rows': len(month),
+                    'timestamp_min': month.index.min(),
+                    'timestamp_max': month.index.max(),
+                    'AQI_min': month['AQI'].min(),
+                    'AQI_max': month['AQI'].max(),
+                })
+        os.replace(tmp_path, path)
+
+    return pd.DataFrame(stats)
+
+
+def save_partition_index(index, key):
+    store_path = feature_store_path(key)
+    write_parquet_atomic(index, os.path.join(store_path, PARTITION_INDEX_FILE))
+    write_json_atomic(os.path.join(store_path, PARTITION_META_FILE), {'version': store_version(key)})
+
+
+def build_partitions(key):
+    save_partition_index(write_partitions(read_store(key), key), key)
+
+
+def append_partitions(delta, key):
+    # New readings go to new files in their partitions, so earlier files and statistics stay valid
+    index_path = os.path.join(feature_store_path(key), PARTITION_INDEX_FILE)
+    if not os.path.exists(index_path):
+        return
+
+    index = pd.read_parquet(index_path)
+    appended = write_partitions(delta, key, suffix=f"-{time.time_ns()}")
+    save_partition_index(pd.concat([index, appended], ignore_index=True), key)
+
+
+def partition_version(key):
+    meta_path = os.path.join(feature_store_path(key), PARTITION_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)['version']
+
+
+@st.cache_data
+def read_partition_index(key, version):
+    return pd.read_parquet(os.path.join(feature_store_path(key), PARTITION_INDEX_FILE))
+
+
+def load_partition_index(key=None):
+    key = key or feature_store_key()
+    if not os.path.exists(os.path.join(feature_store_path(key), TRANSFORMED_FILE)):
+        build_store(key)
+
+    # Built once per store version; compaction or a store written by an older version triggers a rebuild
+    version = store_version(key)
+    if partition_version(key) != version:
+        build_partitions(key)
+
+    return read_partition_index(key, version)
+
+
+def category_range(categories):
+    bounds = [(AQI_CATEGORY_BINS[i], AQI_CATEGORY_BINS[i + 1]) for i, label in enumerate(AQI_CATEGORY_LABELS)
+              if label in categories]
+    return min(low for low, _ in bounds), max(high for _, high in bounds)
+
+
+def prune_partitions(index, stations=None, start=None, end=None, categories=None):
+    keep = np.ones(len(index), dtype=bool)
+
+    if stations:
+        keep &= index['station'].isin(stations).to_numpy()
+    if start is not None:
+        keep &= (index['timestamp_max'] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        keep &= (index['timestamp_min'] < pd.Timestamp(end) + pd.Timedelta(days=1)).to_numpy()
+    if categories:
+        # A file can only hold the selected categories if its AQI range overlaps theirs
+        low, high = category_range(categories)
+        keep &= ((index['AQI_max'] >= low) & (index['AQI_min'] < high)).to_numpy()
+
+    return index[keep]
+
+
+def filter_mask(df, stations=None, start=None, end=None, categories=None):
+    # Row-level version of the same filters; `end` is an inclusive date
+    mask = np.ones(len(df), dtype=bool)
+
+    if stations:
+        mask &= df['station'].isin(stations).to_numpy()
+    if start is not None:
+        mask &= np.asarray(df.index >= pd.Timestamp(start))
+    if end is not None:
+        mask &= np.asarray(df.index < pd.Timestamp(end) + pd.Timedelta(days=1))
+    if categories:
+        mask &= df['AQI_category'].isin(categories).to_numpy()
+
+    return mask
+
+
+def query_transformed(stations=None, start=None, end=None, categories=None, columns=None, key=None):
+    key = key or feature_store_key()
+    index = prune_partitions(load_partition_index(key), stations, start, end, categories)
+    store_path = feature_store_path(key)
+
+    # Only the row groups that survive pruning are read, so the cost follows the size of the slice
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + ['station', 'AQI_category']))
+    tables = [pq.ParquetFile(os.path.join(store_path, path)).read_row_groups(list(groups['row_group']),
+                                                                              columns=read_columns)
+              for path, groups in index.groupby('path', sort=False)]
+    base_schema = pq.read_schema(os.path.join(store_path, TRANSFORMED_FILE))
+    if not tables:
+        empty = base_schema.empty_table().to_pandas()
+        return empty if columns is None else empty[list(columns)]
+
+    # Appended files can carry narrower dtypes than the base store, so every file is cast to its schema
+    schema = pa.schema([base_schema.field(name) for name in tables[0].schema.names], metadata=tables[0].schema.metadata)
+    df = pa.concat_tables([table.cast(schema) for table in tables]).to_pandas()
+    df = df[filter_mask(df, stations, start, end, categories)]
+    return df if columns is None else df[list(columns)]
+
+
+@profiled_cache(st.cache_resource, max_entries=QUERY_CACHE_ENTRIES, ttl=QUERY_CACHE_TTL)
+def query_dataset(version, stations=None, start=None, end=None, categories=None):
+    # `version` (the store version) keys the cache, so appended readings show up in new queries
+    df = query_transformed(stations, start, end, categories)
+    query = f"query stations={stations} start={start} end={end} categories={categories}"
+    return DatasetHandle(df, version, ('transformed', query))
+
+
+def load_filtered_dataset(filters):
+    return query_dataset(store_version(feature_store_key()), **filters)
+
+
+@cache_stage
+def slice_rollups(dataset):
+    return build_rollups(dataset.data)
+
+
+def sidebar_filters(index):
+    st.sidebar.markdown("### 🔎 Filters")
+    stations = st.sidebar.multiselect("Stations", sorted(index['station'].unique()))
+
+    first_day = index['timestamp_min'].min().date()
+    last_day = index['timestamp_max'].max().date()
+    dates = st.sidebar.date_input("Date range", (first_day, last_day), min_value=first_day, max_value=last_day)
+    # The widget returns a single date while the user is still picking the end of the range
+    start, end = (dates[0], dates[-1]) if isinstance(dates, (tuple, list)) and dates else (first_day, last_day)
+
+    categories = st.sidebar.multiselect("AQI category", AQI_CATEGORY_LABELS)
+
+    return {
+        'stations': tuple(stations) or None,
+        'start': start if start > first_day else None,
+        'end': end if end < last_day else None,
+        'categories': tuple(categories) or None,
+    }
+
+
+def filters_active(filters):
+    return any(value is not None for value in filters.values())
@@ -0,0 +1,200 @@
+import collections
+import hashlib
+import io
+import json
+import os
+import threading
+
+import matplotlib
+import matplotlib.pyplot as plt
+import streamlit as st
+
+from utils.profiling import profile_stage
+
+RENDER_CACHE_DIR = os.environ.get("AQI_RENDER_CACHE_DIR", os.path.join("data", "render_cache"))
+MEMORY_CACHE_BYTES = int(os.environ.get("AQI_RENDER_MEMORY_BYTES", 64 * 2**20))
+DISK_CACHE_BYTES = int(os.environ.get("AQI_RENDER_DISK_BYTES", 512 * 2**20))
+# Disk eviction trims the directory to this fraction of DISK_CACHE_BYTES, so it doesn't run on every write
+DISK_EVICT_TARGET = 0.9
+# Same resolution and cropping st.pyplot uses
+DEFAULT_DPI = 200
+FORMATS = ('png', 'svg')
+
+# pyplot keeps a global "current figure", so figures are drawn one at a time across sessions
+render_lock = threading.Lock()
+
+
+def figure_bytes(fig, fmt='png', dpi=DEFAULT_DPI):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=dpi, bbox_inches='tight')
+    # Only the bytes are kept, so the artist tree can be released right away
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+class RenderCache:
+    # Rendered chart bytes in an in-process LRU bounded by total size, backed by a directory that
+    # other server processes and restarts share. A chart missing from both tiers is rendered by one
+    # caller while concurrent callers for the same key wait for its result
+    def __init__(self, directory=RENDER_CACHE_DIR, memory_bytes=MEMORY_CACHE_BYTES, disk_bytes=DISK_CACHE_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        # Bytes on disk as of the last directory scan plus this process's writes since; None until scanned
+        self.disk_size = None
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.stats = collections.Counter()
+
+    def disk_path(self, key, fmt):
+        return os.path.join(self.directory, f"{key}.{fmt}")
+
+    def get_memory(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def put_memory(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.memory_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats['memory_evictions'] += 1
+
+    def get_disk(self, key, fmt):
+        path = self.disk_path(key, fmt)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Touched on read, so disk eviction drops the least recently used files first
+        os.utime(path)
+        return data
+
+    def put_disk(self, key, fmt, data):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.disk_path(key, fmt)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            if self.disk_size is None:
+                self.disk_size = self.scan_disk()[1]
+            else:
+                self.disk_size += len(data)
+            over = self.disk_size > self.disk_bytes
+        # Writes from other processes are only seen by the next scan, which eviction starts with
+        if over:
+            self.evict_disk()
+
+    def scan_disk(self):
+        files = [entry for entry in os.scandir(self.directory) if entry.is_file() and '.tmp-' not in entry.name]
+        return files, sum(entry.stat().st_size for entry in files)
+
+    def evict_disk(self):
+        files, total = self.scan_disk()
+        target = self.disk_bytes * DISK_EVICT_TARGET
+        if total > self.disk_bytes:
+            for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+                if total <= target:
+                    break
+                try:
+                    total -= entry.stat().st_size
+                    os.remove(entry.path)
+                    self.stats['disk_evictions'] += 1
+                except FileNotFoundError:
+                    pass
+        with self.lock:
+            self.disk_size = total
+
+    def key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def lookup(self, key, fmt):
+        data = self.get_memory(key)
+        if data is not None:
+            return data, 'memory'
+        data = self.get_disk(key, fmt) if self.directory else None
+        if data is not None:
+            self.put_memory(key, data)
+            return data, 'disk'
+        return None, None
+
+    def get_or_render(self, key, fmt, render):
+        data, tier = self.lookup(key, fmt)
+        if data is None:
+            with self.key_lock(key):
+                # Another session may have rendered it while this one waited
+                data, tier = self.lookup(key, fmt)
+                if data is None:
+                    data, tier = render(), 'render'
+                    self.put_memory(key, data)
+                    self.put_disk(key, fmt, data)
+            with self.lock:
+                self.key_locks.pop(key, None)
+
+        self.stats[tier] += 1
+        return data, tier
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+@st.cache_resource
+def load_render_cache():
+    return RenderCache()
+
+
+def chart_key(chart, version, args, size, dpi, fmt):
+    payload = json.dumps([chart, version, [repr(arg) for arg in args], size, dpi, fmt,
+                          matplotlib.__version__])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_chart(plot, data, *args, version=None, size=None, dpi=DEFAULT_DPI, fmt='png'):
+    # Bytes of plot(data, *args), rendered once per (chart, data version, arguments, size, DPI, format)
+    # and then served from the cache. A DatasetHandle carries its version; any other data needs an
+    # explicit `version` naming what it was derived from (a dataset fingerprint, a model version)
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {FORMATS}, got {fmt!r}")
+    version = version or getattr(data, 'fingerprint', None)
+    if version is None:
+        raise ValueError(f"{plot.__name__}: pass `version` for data without a dataset fingerprint")
+    key = chart_key(plot.__name__, version, args, size, dpi, fmt)
+
+    def render():
+        with render_lock:
+            fig = plot(data, *args)
+            if size is not None:
+                fig.set_size_inches(size)
+            return figure_bytes(fig, fmt, dpi)
+
+    with profile_stage(f"render[{plot.__name__}]") as record:
+        data_bytes, tier = load_render_cache().get_or_render(key, fmt, render)
+        record['cache'] = 'miss' if tier == 'render' else 'hit'
+        record['tier'] = tier
+    return data_bytes
+
+
+def show_chart(plot, data, *args, fmt='png', **kwargs):
+    image = render_chart(plot, data, *args, fmt=fmt, **kwargs)
+    # st.image takes SVG as markup rather than bytes
+    st.image(image.decode() if fmt == 'svg' else image, width='stretch')
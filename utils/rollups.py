@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+# Finest grain every chart aggregates from; coarser views are re-aggregated from it
+CUBE_KEYS = ['station', 'year', 'month']
+CUBE_COLS = ['AQI', 'vehicle_pollution', 'industrial_pollution', 'TEMP', 'DEWP']
+CORRELATION_COLS = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3', 'TEMP', 'PRES', 'DEWP', 'RAIN', 'WSPM', 'AQI',
+                    'vehicle_pollution', 'industrial_pollution']
+
+
+def build_rollups(df):
+    # (sum, count) per station/year/month: sums and counts add up, so cubes from different
+    # batches can be merged and re-aggregated to any coarser grain without the hourly rows
+    grouped = df.groupby(CUBE_KEYS, observed=True)[CUBE_COLS]
+    cube = grouped.sum().add_suffix('_sum').join(grouped.count().add_suffix('_count')).reset_index()
+
+    return {'cube': cube, 'moments': pairwise_moments(df[CORRELATION_COLS].to_numpy(dtype=float))}
+
+
+def moments_frame(n, mean, m2, comoment, cols=CORRELATION_COLS):
+    # Long format, one row per (x, y) column pair: n counts the rows where both are present, and
+    # mean/m2 describe x over those rows, so a pair's statistics match pandas' pairwise .corr()
+    x, y = np.meshgrid(cols, cols, indexing='ij')
+    return pd.DataFrame({'x': x.ravel(), 'y': y.ravel(), 'n': n.ravel(), 'mean': mean.ravel(),
+                         'm2': m2.ravel(), 'comoment': comoment.ravel()})
+
+
+def moment_matrices(moments, cols=CORRELATION_COLS):
+    moments = moments.set_index(['x', 'y']).reindex(pd.MultiIndex.from_product([cols, cols]))
+    return [moments[name].to_numpy().reshape(len(cols), len(cols)) for name in ['n', 'mean', 'm2', 'comoment']]
+
+
+def pairwise_moments(values, cols=CORRELATION_COLS):
+    # Values are centered on their column means before the sums of squares and products are taken,
+    # so the variances don't come from subtracting two large, nearly equal sums
+    present = ~np.isnan(values)
+    with np.errstate(invalid='ignore'):
+        shift = np.nan_to_num(np.nanmean(values, axis=0)) if len(values) else np.zeros(len(cols))
+    centered = np.where(present, values - shift, 0.0)
+    weights = present.astype(float)
+
+    n = weights.T @ weights
+    sums = centered.T @ weights
+    squares = (centered ** 2).T @ weights
+    products = centered.T @ centered
+
+    safe_n = np.where(n > 0, n, 1)
+    mean = np.where(n > 0, shift[:, None] + sums / safe_n, 0.0)
+    m2 = np.where(n > 0, squares - sums ** 2 / safe_n, 0.0)
+    comoment = np.where(n > 0, products - sums * sums.T / safe_n, 0.0)
+    return moments_frame(n, mean, m2, comoment, cols)
+
+
+def merge_moments(left, right, cols=CORRELATION_COLS):
+    # Chan et al.'s parallel update: the batches' means are combined with a correction for their difference
+    n_a, mean_a, m2_a, co_a = moment_matrices(left, cols)
+    n_b, mean_b, m2_b, co_b = moment_matrices(right, cols)
+    n = n_a + n_b
+    safe_n = np.where(n > 0, n, 1)
+    delta = mean_b - mean_a
+    weight = n_a * n_b / safe_n
+
+    mean = np.where(n > 0, mean_a + delta * n_b / safe_n, 0.0)
+    m2 = m2_a + m2_b + delta ** 2 * weight
+    comoment = co_a + co_b + delta * delta.T * weight
+    return moments_frame(n, mean, m2, comoment, cols)
+
+
+def merge_rollups(left, right):
+    cube = pd.concat([left['cube'], right['cube']]).groupby(CUBE_KEYS, as_index=False).sum()
+    return {'cube': cube, 'moments': merge_moments(left['moments'], right['moments'])}
+
+
+def rollup(cube, by, cols, stat='mean'):
+    grouped = cube.groupby(by)[[f"{col}_sum" for col in cols] + [f"{col}_count" for col in cols]].sum()
+
+    if stat == 'sum':
+        result = pd.DataFrame({col: grouped[f"{col}_sum"] for col in cols})
+    else:
+        result = pd.DataFrame({col: grouped[f"{col}_sum"] / grouped[f"{col}_count"] for col in cols})
+
+    return result.reset_index()
+
+
+def correlation_matrix(moments, cols=CORRELATION_COLS):
+    # Pairwise-complete Pearson correlations, as DataFrame.corr() computes them
+    _, _, m2, comoment = moment_matrices(moments, cols)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = comoment / np.sqrt(m2 * m2.T)
+    return pd.DataFrame(np.clip(corr, -1, 1), index=cols, columns=cols)
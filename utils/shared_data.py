@@ -0,0 +1,121 @@
+import contextlib
+import glob
+import hashlib
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Where published frames live; by default next to the feature store, so the OS page cache shares
+# them between worker processes. Point it at /dev/shm to keep them in RAM only
+SHARED_DIR = os.environ.get("AQI_SHARED_DIR")
+SHARED_SUBDIR = "shared"
+SERIES_KEY = b"aqi_series_name"
+
+
+def shared_name(prefix, *versions):
+    # File-system safe name that changes with any of the version strings
+    return f"{prefix}-{hashlib.sha256('|'.join(versions).encode()).hexdigest()[:16]}"
+
+
+def write_arrow(value, path):
+    # Uncompressed Arrow IPC, so readers can memory-map the column buffers as they are on disk
+    metadata = None
+    if isinstance(value, pd.Series):
+        metadata = {SERIES_KEY: str(value.name).encode()}
+        value = value.to_frame(name=str(value.name))
+
+    table = pa.Table.from_pandas(value, preserve_index=True)
+    if metadata:
+        table = table.replace_schema_metadata({**table.schema.metadata, **metadata})
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def attach_arrow(path):
+    # split_blocks keeps one block per column, so numeric columns point straight into the mapped
+    # file instead of being consolidated into a private copy. Strings stay Arrow-backed as well;
+    # only the index and categorical codes are materialized. The arrays are read-only, and
+    # Copy-on-Write copies a column when a session writes to it
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    df = table.to_pandas(split_blocks=True)
+
+    metadata = table.schema.metadata or {}
+    if SERIES_KEY in metadata:
+        return df.iloc[:, 0]
+    return df
+
+
+@contextlib.contextmanager
+def publish_lock(directory, name):
+    # One process builds and writes a frame while the others wait, then attach to its file
+    if fcntl is None:
+        yield
+        return
+    path = os.path.join(directory, f"{name}.lock")
+    while True:
+        lock_file = open(path, 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # remove_stale may have unlinked the file while this process waited; then lock the one at the path now
+        try:
+            if os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+    try:
+        yield
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def remove_lock(path):
+    # Only while holding it, so no process is building under it; one that opened it before the unlink
+    # notices in publish_lock and locks a fresh file
+    with contextlib.suppress(FileNotFoundError), open(path) as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        os.remove(path)
+
+
+def remove_stale(directory, prefix, keep):
+    # Files of older versions; processes still mapping them keep their pages until they let go
+    for path in glob.glob(os.path.join(directory, f"{prefix}-*")):
+        if os.path.basename(path).startswith(keep):
+            continue
+        if path.endswith('.arrow'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        elif path.endswith('.lock') and fcntl is not None:
+            remove_lock(path)
+
+
+def shared_frames(directory, name, build, count=1):
+    # `count` frames (or Series) published once under `name` and attached read-only by every process.
+    # `build` only runs in the first process to get here for this name
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, f"{name}.{i}.arrow") for i in range(count)]
+
+    if not all(os.path.exists(path) for path in paths):
+        with publish_lock(directory, name):
+            if not all(os.path.exists(path) for path in paths):
+                values = build()
+                values = values if isinstance(values, tuple) else (values,)
+                for value, path in zip(values, paths):
+                    write_arrow(value, path)
+                del values
+                remove_stale(directory, name.rsplit('-', 1)[0], name)
+
+    return tuple(attach_arrow(path) for path in paths)
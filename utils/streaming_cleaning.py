@@ -0,0 +1,176 @@
+import argparse
+import copy
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.preprocessing import CHUNK_SIZE, DATA_PATH, iter_data_chunks
+from utils.quantile_sketch import DEFAULT_K, DEFAULT_SEED, KLLSketch
+
+# same exclusions as outlier_handling: identifiers and calendar fields are never clipped
+WINSORIZE_EXCLUDED = ['No', 'year', 'month', 'day', 'hour']
+LOWER_QUANTILE = 0.01
+UPPER_QUANTILE = 0.99
+
+
+# Pass one: per-column statistics that can be gathered chunk by chunk and merged across partitions
+class CleaningStats:
+    def __init__(self, k=DEFAULT_K, seed=DEFAULT_SEED):
+        self.k = k
+        self.seed = seed
+        self.sums = {}
+        self.counts = {}
+        self.nulls = {}
+        self.value_counts = {}
+        self.sketches = {}
+
+    def update(self, chunk):
+        for col in chunk.select_dtypes(include=['number']).columns:
+            values = chunk[col].to_numpy(dtype=float)
+            present = ~np.isnan(values)
+            self.sums[col] = self.sums.get(col, 0.0) + values[present].sum()
+            self.counts[col] = self.counts.get(col, 0) + int(present.sum())
+            self.nulls[col] = self.nulls.get(col, 0) + int(len(values) - present.sum())
+
+            if col not in WINSORIZE_EXCLUDED:
+                self.sketches.setdefault(col, KLLSketch(self.k, self.seed)).update(values[present])
+
+        for col in chunk.select_dtypes(include=['category', 'object', 'string']).columns:
+            counts = chunk[col].value_counts(dropna=True)
+            counts.index = counts.index.astype(object)
+            self.value_counts[col] = counts.add(self.value_counts[col], fill_value=0) if col in self.value_counts else counts
+
+        return self
+
+    def merge(self, other):
+        for col in other.counts:
+            self.sums[col] = self.sums.get(col, 0.0) + other.sums[col]
+            self.counts[col] = self.counts.get(col, 0) + other.counts[col]
+            self.nulls[col] = self.nulls.get(col, 0) + other.nulls[col]
+        for col, counts in other.value_counts.items():
+            self.value_counts[col] = counts.add(self.value_counts[col], fill_value=0) if col in self.value_counts else counts
+        for col, sketch in other.sketches.items():
+            if col in self.sketches:
+                self.sketches[col].merge(sketch)
+            else:
+                self.sketches[col] = copy.deepcopy(sketch)
+
+        return self
+
+    def cleaning_params(self, lower_q=LOWER_QUANTILE, upper_q=UPPER_QUANTILE):
+        means = {col: self.sums[col] / self.counts[col] for col in self.counts if self.counts[col]}
+
+        # Ties go to the smallest value, like SimpleImputer(strategy='most_frequent')
+        modes = {}
+        for col, counts in self.value_counts.items():
+            top = counts[counts == counts.max()]
+            modes[col] = sorted(top.index)[0]
+
+        bounds = {}
+        quantile_error = {}
+        for col, sketch in self.sketches.items():
+            # outlier_handling runs after imputation, so the imputed means count towards the quantiles,
+            # exactly and without being inserted into the sketch
+            imputed = (means[col], self.nulls[col]) if self.nulls[col] and col in means else None
+
+            bounds[col] = (float(sketch.quantile(lower_q, imputed)), float(sketch.quantile(upper_q, imputed)))
+            quantile_error[col] = {
+                'rank_error': sketch.rank_error(imputed[1] if imputed else 0),
+                'lower_range': [float(v) for v in sketch.quantile_bounds(lower_q, imputed)],
+                'upper_range': [float(v) for v in sketch.quantile_bounds(upper_q, imputed)],
+            }
+
+        return {
+            'means': means,
+            'modes': modes,
+            'bounds': bounds,
+            'quantiles': [lower_q, upper_q],
+            'quantile_error': quantile_error,
+        }
+
+
+def _collect_partition_stats(path, chunksize=CHUNK_SIZE, k=DEFAULT_K, seed=DEFAULT_SEED):
+    stats = CleaningStats(k, seed)
+    for chunk in iter_data_chunks(path, chunksize=chunksize):
+        stats.update(chunk)
+    return stats
+
+
+def collect_cleaning_stats(paths, chunksize=CHUNK_SIZE, k=DEFAULT_K, max_workers=1, seed=DEFAULT_SEED):
+    # One seed per partition, derived from `seed`: reproducible, and independent compactions across partitions
+    seeds = [[seed, i] for i in range(len(paths))]
+    if max_workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            partition_stats = list(executor.map(_collect_partition_stats, paths,
+                                                [chunksize] * len(paths), [k] * len(paths), seeds))
+    else:
+        partition_stats = [_collect_partition_stats(path, chunksize, k, seed)
+                           for path, seed in zip(paths, seeds)]
+
+    stats = partition_stats[0]
+    for other in partition_stats[1:]:
+        stats.merge(other)
+    return stats
+
+
+# Pass two: impute and clip one chunk with the fitted parameters
+def apply_cleaning(chunk, params):
+  fill_values = {col: value for col, value in {**params['means'], **params['modes']}.items() if col in chunk}
+
+  for col, mode in params['modes'].items():
+    # chunk categories are inferred per chunk, so the global mode may be missing from them
+    if col in chunk and isinstance(chunk[col].dtype, pd.CategoricalDtype) and mode not in chunk[col].cat.categories:
+      chunk[col] = chunk[col].cat.add_categories([mode])
+
+  chunk = chunk.fillna(value=fill_values)
+
+  clipped_cols = [col for col in params['bounds'] if col in chunk]
+  lower = pd.Series({col: params['bounds'][col][0] for col in clipped_cols})
+  upper = pd.Series({col: params['bounds'][col][1] for col in clipped_cols})
+  chunk[clipped_cols] = chunk[clipped_cols].clip(lower=lower, upper=upper, axis=1)
+
+  return chunk
+
+
+def _clean_partition(path, output_path, params, chunksize=CHUNK_SIZE):
+    rows = 0
+    for i, chunk in enumerate(iter_data_chunks(path, chunksize=chunksize)):
+        chunk = apply_cleaning(chunk, params)
+        chunk.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        rows += len(chunk)
+    return rows
+
+
+def clean_streaming(paths, output_dir, chunksize=CHUNK_SIZE, k=DEFAULT_K, max_workers=1, seed=DEFAULT_SEED):
+    stats = collect_cleaning_stats(paths, chunksize, k, max_workers, seed)
+    params = stats.cleaning_params()
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_paths = [os.path.join(output_dir, os.path.basename(path)) for path in paths]
+
+    if max_workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            rows = list(executor.map(_clean_partition, paths, output_paths,
+                                     [params] * len(paths), [chunksize] * len(paths)))
+    else:
+        rows = [_clean_partition(path, output_path, params, chunksize) for path, output_path in zip(paths, output_paths)]
+
+    params['rows'] = dict(zip(output_paths, rows))
+    return params
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Impute and winsorize air quality CSV partitions without loading them whole.')
+    parser.add_argument('paths', nargs='*', default=[DATA_PATH], help='input CSV partitions')
+    parser.add_argument('--output-dir', default=os.path.join('data', 'cleaned'))
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--sketch-k', type=int, default=DEFAULT_K)
+    parser.add_argument('--sketch-seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    report = clean_streaming(args.paths, args.output_dir, args.chunksize, args.sketch_k, args.workers, args.sketch_seed)
+    print(json.dumps(report, indent=2, default=str))
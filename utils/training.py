@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import xgboost as xgb
+from sklearn.ensemble import AdaBoostRegressor, RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+from utils.compact_trees import compact_ada_boost, compact_forest, save_compact_model
+from utils.feature_store import current_store_version, feature_store_key, load_transformed_dataset
+from utils.model_registry import MODEL_DIR, load_selected_features
+from utils.modeling_utils import (
+    FEATURE_IMPORTANCE_FILE,
+    apply_preprocessor,
+    compute_feature_importances,
+    fit_preprocessor,
+    lagged_dataset,
+    read_preprocessor,
+    save_feature_importances,
+    save_preprocessor,
+    splitting_data_set
+)
+
+# AdaBoost and XGBoost use the grid-search winners of the shipped models. The Random Forest pickle
+# isn't in the repo, so it uses the largest setting of the notebook's grid
+MODEL_PARAMS = {
+    'RandomForest': {'n_estimators': 300, 'max_depth': 15, 'min_samples_split': 2, 'min_samples_leaf': 1,
+                     'random_state': 42},
+    'AdaBoost': {'n_estimators': 50, 'learning_rate': 0.1, 'random_state': 42},
+    'XGBoost': {'n_estimators': 100, 'max_depth': 10, 'learning_rate': 0.1, 'subsample': 0.8,
+                'colsample_bytree': 1.0, 'random_state': 42},
+}
+MODEL_FILES = {
+    'RandomForest': "random_forest_model.pkl",
+    'AdaBoost': "ada_boost_model.pkl",
+    'XGBoost': "xgb_model.json",
+}
+CHECKPOINT_FILE = "training_checkpoint.json"
+# The feature importance forest runs alongside the models and shares their thread budget
+IMPORTANCE_JOB = 'FeatureImportance'
+
+
+def thread_budgets(threads, jobs=(*MODEL_FILES, IMPORTANCE_JOB)):
+    # Jobs running side by side never use more than `threads` threads in total. AdaBoost fits its
+    # trees one after another, so it gets a single thread; the spare threads are split between the
+    # jobs that can use more, the first extra one going to the slower forest. With fewer threads than
+    # jobs every job gets one thread, and train_models runs at most `threads` jobs at once
+    budgets = {job: 1 for job in jobs}
+    parallel = sorted((job for job in jobs if job != 'AdaBoost'), key=lambda job: job != 'RandomForest')
+    spare = threads - len(jobs)
+    for i, job in enumerate(parallel if spare > 0 else []):
+        budgets[job] += spare // len(parallel) + (i < spare % len(parallel))
+    return budgets
+
+
+def build_model(name, threads):
+    params = MODEL_PARAMS[name]
+    if name == 'RandomForest':
+        return RandomForestRegressor(n_jobs=threads, **params)
+    if name == 'AdaBoost':
+        return AdaBoostRegressor(**params)
+    return xgb.XGBRegressor(n_jobs=threads, **params)
+
+
+def regression_metrics(y_true, y_pred):
+    mse = mean_squared_error(y_true, y_pred)
+    return {
+        'MAE': float(mean_absolute_error(y_true, y_pred)),
+        'MSE': float(mse),
+        'RMSE': float(np.sqrt(mse)),
+        'R2': float(r2_score(y_true, y_pred)),
+    }
+
+
+def save_model(name, model, output_dir):
+    path = os.path.join(output_dir, MODEL_FILES[name])
+    tmp_path = f"{path}.tmp"
+    if name == 'XGBoost':
+        model.get_booster().save_model(f"{tmp_path}.json")
+        os.replace(f"{tmp_path}.json", path)
+        return
+
+    # Uncompressed, so the model registry can memory-map it
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+
+    # The registry prefers the flat-array export, so it has to be refreshed with the model
+    compact_model = compact_forest(model) if name == 'RandomForest' else compact_ada_boost(model)
+    save_compact_model(compact_model, output_dir, name)
+
+
+def run_id(data_key, selected_features, preprocessor):
+    # Checkpointed models are only reused when they were trained with the same preprocessor
+    payload = json.dumps({'data': data_key, 'params': MODEL_PARAMS, 'features': list(selected_features),
+                          'preprocessor': joblib.hash(preprocessor)}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def read_checkpoint(output_dir, current_run):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    return checkpoint['models'] if checkpoint.get('run') == current_run else {}
+
+
+def write_checkpoint(output_dir, current_run, completed):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump({'run': current_run, 'models': completed}, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def train_model(name, threads, X_train, y_train, X_test, y_test, output_dir):
+    model = build_model(name, threads)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    test_pred = model.predict(X_test)
+    predict_seconds = time.perf_counter() - start
+    save_model(name, model, output_dir)
+
+    return {
+        'file': MODEL_FILES[name],
+        'threads': threads,
+        'fit_seconds': round(fit_seconds, 3),
+        'predict_seconds': round(predict_seconds, 3),
+        'train_metrics': regression_metrics(y_train, model.predict(X_train)),
+        'test_metrics': regression_metrics(y_test, test_pred),
+    }
+
+
+def train_models(output_dir=MODEL_DIR, model_names=tuple(MODEL_FILES), threads=None, resume=True):
+    threads = threads or os.cpu_count()
+    os.makedirs(output_dir, exist_ok=True)
+    timings = {}
+    start = time.perf_counter()
+
+    # Same lag features and station/time split as the dashboard's execute_data_preprocessing. The
+    # encoders and scaler are refitted on this training split when every model is retrained; a partial
+    # run keeps the saved preprocessor, which the models it doesn't retrain are served with
+    stage = time.perf_counter()
+    dataset = lagged_dataset(load_transformed_dataset(current_store_version()))
+    X_train, y_train, X_test, y_test = splitting_data_set(dataset)
+    preprocessor = None if set(MODEL_FILES) <= set(model_names) else read_preprocessor(output_dir)
+    refit_preprocessor = preprocessor is None
+    if refit_preprocessor:
+        preprocessor = fit_preprocessor(X_train)
+    selected_features = load_selected_features(MODEL_DIR)
+    joblib.dump(selected_features, os.path.join(output_dir, "selected_features.pkl"))
+    X_train_all = apply_preprocessor(X_train, preprocessor)
+    X_train_selected = X_train_all[selected_features]
+    X_test_selected = apply_preprocessor(X_test, preprocessor, selected_features)
+    timings['preprocessing_seconds'] = round(time.perf_counter() - stage, 3)
+
+    current_run = run_id(feature_store_key(), selected_features, preprocessor)
+    completed = read_checkpoint(output_dir, current_run) if resume else {}
+    pending = [name for name in model_names
+               if name not in completed or not os.path.exists(os.path.join(output_dir, MODEL_FILES[name]))]
+    compute_importances = bool(pending) or not os.path.exists(os.path.join(output_dir, FEATURE_IMPORTANCE_FILE))
+    jobs = pending + [IMPORTANCE_JOB] * compute_importances
+    budgets = thread_budgets(threads, jobs)
+
+    # Each model trains in its own thread with its own thread budget; the native fit loops release the GIL
+    stage = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(min(len(jobs), threads), 1)) as executor:
+        futures = {executor.submit(train_model, name, budgets[name], X_train_selected, y_train,
+                                   X_test_selected, y_test, output_dir): name for name in pending}
+        importances = None
+        if compute_importances:
+            importances = executor.submit(compute_feature_importances, X_train_all, y_train,
+                                          n_jobs=budgets[IMPORTANCE_JOB])
+
+        for future in as_completed(futures):
+            completed[futures[future]] = future.result()
+            # Checkpoint after every model, so a rerun after a failure only trains what is missing
+            write_checkpoint(output_dir, current_run, completed)
+    timings['training_seconds'] = round(time.perf_counter() - stage, 3)
+
+    # Both artifacts are stamped with the hash of the model files, so they are written last. A partial
+    # run saves the preprocessor it reused, which only renews the stamp
+    save_preprocessor(preprocessor, output_dir)
+    if importances is not None:
+        save_feature_importances(importances.result(), 'forest', output_dir)
+    timings['total_seconds'] = round(time.perf_counter() - start, 3)
+
+    return {
+        'run': current_run,
+        'data_version': feature_store_key(),
+        'output_dir': output_dir,
+        'train_rows': len(X_train),
+        'test_rows': len(X_test),
+        'selected_features': list(selected_features),
+        'threads': threads,
+        'thread_budgets': budgets,
+        'refit_preprocessor': refit_preprocessor,
+        'resumed': sorted(set(completed) - set(pending)),
+        'timings': timings,
+        'models': {name: completed[name] for name in model_names},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the AQI models and write a JSON report.')
+    parser.add_argument('--output-dir', default=MODEL_DIR)
+    parser.add_argument('--models', nargs='+', choices=list(MODEL_FILES), default=list(MODEL_FILES))
+    parser.add_argument('--threads', type=int, default=None, help='total thread budget (default: all cores)')
+    parser.add_argument('--no-resume', action='store_true', help='retrain models already checkpointed for this data')
+    parser.add_argument('--report', default=None, help='JSON report path (default: <output-dir>/training_report.json)')
+    args = parser.parse_args()
+
+    report = train_models(args.output_dir, args.models, args.threads, not args.no_resume)
+    report_path = args.report or os.path.join(args.output_dir, "training_report.json")
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))